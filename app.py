@@ -1,11 +1,36 @@
 import streamlit as st
 import os
-from github_podcast_generator import GitHubPodcastGenerator # Importa a classe refatorada
+import io
+import functools
+import logging
 from dotenv import load_dotenv
 import re
-
-# Carrega variáveis de ambiente (útil para desenvolvimento local com .env)
-load_dotenv()
+import string
+import tempfile
+import threading
+import queue
+import time
+import traceback
+
+# --- Carregamentos únicos por processo (o Streamlit reexecuta este script a cada interação) ---
+@functools.lru_cache(maxsize=1)
+def _load_env():
+    """Carrega variáveis de ambiente do .env (útil para desenvolvimento local) uma única vez."""
+    load_dotenv()
+
+@functools.lru_cache(maxsize=1)
+def _load_generator_module():
+    """Importa o gerador (Gemini, gTTS, Pydub...) só quando ele é de fato necessário."""
+    import github_podcast_generator # Módulo com a classe refatorada e suas exceções
+    return github_podcast_generator
+
+_load_env()
+
+# Log de console: silencioso por padrão em produção (LOGLEVEL=DEBUG para ver o progresso)
+logger = logging.getLogger("podcastgit")
+logger.setLevel(os.environ.get("LOGLEVEL", "WARNING").upper())
+if not logger.handlers: # O script roda de novo a cada rerun; evita handlers duplicados
+    logger.addHandler(logging.StreamHandler())
 
 # --- Configuração da Página ---
 st.set_page_config(
@@ -15,23 +40,42 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- Padrões Regex (compilados uma única vez por processo) ---
+_GH_URL_RE = re.compile(r'^https://github\.com/[\w\-]+/[\w\-\.]+(?:/tree/[\w\-\.]+)?/?$')
+
+# --- Tabela para nomes de arquivo seguros (str.translate resolve em C, sem regex) ---
+_SAFE_NAME_CHARS = set(string.ascii_letters + string.digits + "_-")
+_SAFE_NAME_TABLE = {c: (chr(c) if chr(c) in _SAFE_NAME_CHARS else '_') for c in range(256)}
+
 # --- Funções Auxiliares ---
 def is_valid_github_url(url):
     """Verifica se a URL parece ser uma URL válida do GitHub."""
-    pattern = r'^https://github\.com/[\w\-]+/[\w\-\.]+(?:/tree/[\w\-\.]+)?/?$'
-    return re.match(pattern, url) is not None
+    return _GH_URL_RE.match(url) is not None
+
+# --- Cache dos clientes (Gemini e sessões HTTP), compartilhados entre reruns e sessões ---
+# Só a parte sem estado fica em cache: cada geração usa um GitHubPodcastGenerator novo,
+# então execuções simultâneas (de outras abas/usuários) não se enxergam.
+@st.cache_resource(show_spinner=False)
+def get_clients(api_key, github_token):
+     try:
+        # Passa os tokens explicitamente
+        return _load_generator_module().GeneratorClients(gemini_api_key=api_key, github_token=github_token)
+     except Exception as e:
+         st.error(f"Erro ao inicializar o gerador: {e}")
+         st.stop()
 
-# --- Cache para a Classe (Opcional, mas pode ajudar a reter estado entre reruns) ---
-# @st.cache_resource # Desativado por enquanto, pode causar problemas com estado interno
-def get_generator(api_key, github_token):
+def new_generator(api_key, github_token, elevenlabs_api_key=None):
+     """Gerador para uma execução, sobre os clientes em cache."""
      # Garante que temos uma chave válida antes de instanciar
      if not api_key:
          st.error("API Key da Gemini é necessária para continuar.")
          st.stop() # Impede a execução do restante do script se não houver chave
 
      try:
-        # Passa os tokens explicitamente
-        return GitHubPodcastGenerator(gemini_api_key=api_key, github_token=github_token)
+        GitHubPodcastGenerator = _load_generator_module().GitHubPodcastGenerator
+        # A chave da ElevenLabs é do usuário desta execução: fica só no gerador, fora do cache
+        return GitHubPodcastGenerator(clients=get_clients(api_key, github_token),
+                                      elevenlabs_api_key=elevenlabs_api_key or None)
      except Exception as e:
          st.error(f"Erro ao inicializar o gerador: {e}")
          st.stop()
@@ -44,10 +88,23 @@ st.sidebar.markdown("Transforme um repositório GitHub em um podcast didático p
 
 st.sidebar.header("1. Configuração")
 
+# Chaves de ambiente/secrets são invariantes no processo: resolvidas uma única vez
+@st.cache_resource(show_spinner=False)
+def _resolve_secrets():
+    """Retorna (GOOGLE_API_KEY, GITHUB_TOKEN, ELEVENLABS_API_KEY) do .env ou dos secrets do Streamlit."""
+    def resolve(name):
+        value = os.getenv(name) # Tenta pegar do .env primeiro
+        try:
+            if not value and name in st.secrets:
+                value = st.secrets[name] # Tenta pegar dos secrets do Streamlit
+        except FileNotFoundError: # Sem secrets.toml (ex: execução local só com .env)
+            pass
+        return value or ""
+    return resolve("GOOGLE_API_KEY"), resolve("GITHUB_TOKEN"), resolve("ELEVENLABS_API_KEY")
+
+gemini_api_key_input, github_token_input, elevenlabs_api_key_input = _resolve_secrets()
+
 # Obter API Key (Prioriza secrets, depois .env, depois input)
-gemini_api_key_input = os.getenv("GOOGLE_API_KEY") # Tenta pegar do .env primeiro
-if not gemini_api_key_input and 'GOOGLE_API_KEY' in st.secrets:
-     gemini_api_key_input = st.secrets["GOOGLE_API_KEY"] # Tenta pegar dos secrets do Streamlit
 
 gemini_api_key = st.sidebar.text_input(
     "Sua API Key do Google Gemini",
@@ -57,9 +114,6 @@ gemini_api_key = st.sidebar.text_input(
 )
 
 # Obter GitHub Token (Opcional, mas recomendado)
-github_token_input = os.getenv("GITHUB_TOKEN")
-if not github_token_input and 'GITHUB_TOKEN' in st.secrets:
-     github_token_input = st.secrets["GITHUB_TOKEN"]
 
 github_token = st.sidebar.text_input(
     "Seu GitHub Token (Opcional)",
@@ -69,13 +123,205 @@ github_token = st.sidebar.text_input(
 )
 
 
+# Provedor de TTS (gTTS e Edge TTS são gratuitos; ElevenLabs usa streaming com latência ajustável)
+_TTS_PROVIDERS = {
+    "gTTS (Google, gratuito)": "gtts",
+    "Edge TTS (Microsoft, gratuito)": "edge",
+    "ElevenLabs (streaming)": "elevenlabs",
+}
+tts_provider_label = st.sidebar.selectbox(
+    "Provedor de TTS",
+    list(_TTS_PROVIDERS),
+    help="O Edge TTS (requer o pacote edge-tts) não tem o limite de requisições do gTTS. O ElevenLabs gera o áudio bem mais rápido em roteiros longos, mas requer uma API Key."
+)
+tts_provider = _TTS_PROVIDERS[tts_provider_label]
+elevenlabs_api_key = ""
+tts_streaming_latency = 3
+if tts_provider == "elevenlabs":
+    elevenlabs_api_key = st.sidebar.text_input(
+        "Sua API Key da ElevenLabs",
+        type="password",
+        value=elevenlabs_api_key_input,
+        help="Obtenha em [ElevenLabs](https://elevenlabs.io/app/settings/api-keys)"
+    )
+    tts_streaming_latency = st.sidebar.slider(
+        "Otimização de latência do streaming",
+        min_value=0, max_value=4, value=3,
+        help="0 = melhor qualidade, 4 = menor latência."
+    )
+
+# Formato do áudio final (Opus: arquivo bem menor, mas alguns navegadores antigos não tocam)
+audio_format_label = st.sidebar.selectbox(
+    "Formato do áudio",
+    ["MP3 (compatível com todos os players)", "Opus (arquivo ~3x menor)"],
+    help="O Opus requer ffmpeg com libopus; se não estiver disponível, o podcast sai em MP3."
+)
+audio_format = "opus" if audio_format_label.startswith("Opus") else "mp3"
+
+
 st.sidebar.header("2. Repositório")
 repo_url = st.sidebar.text_input("URL do Repositório GitHub", placeholder="Ex: https://github.com/usuario/projeto")
 
+# --- Pipeline em segundo plano ---
+# A geração (GitHub -> Gemini -> TTS) leva de 30s a alguns minutos. Ela roda numa thread
+# própria e conversa com a interface apenas pelo dicionário `job` guardado na sessão:
+# a thread nunca toca em widgets, e cada rerun só desenha o estado atual.
+class _PipelineCancelled(Exception):
+    """Interrompe o pipeline quando o usuário clica em 'Parar'."""
+
+
+def _run_pipeline(generator, repo_url, audio_format, job):
+    """Executa todas as etapas da geração, publicando progresso e resultados em `job`."""
+    def update_progress(percentage, message):
+        """Callback de progresso (chamado na thread do pipeline)."""
+        if job["cancel"].is_set():
+            raise _PipelineCancelled()
+        job["queue"].put((percentage, message))
+        logger.debug("Progresso: %d%% - %s", int(percentage*100), message) # Formatação adiada pelo logging
+
+    def finish(state, **fields):
+        job.update(fields)
+        job["state"] = state
+
+    def fail(message, **fields):
+        # Etapas do gerador tratam as próprias exceções; um cancelamento pode chegar como falha
+        if job["cancel"].is_set():
+            return finish("cancelled")
+        return finish("error", error=message, **fields)
+
+    try:
+        # --- Etapa 1: URL e estrutura do repositório ---
+        if not generator.parse_github_url(repo_url):
+            return fail("Não foi possível analisar a URL do GitHub. Verifique a URL e tente novamente.")
+
+        update_progress(0.1, f"Analisando {generator.repo_owner}/{generator.repo_name}...")
+
+        if not generator.fetch_repo_structure(progress_callback=update_progress):
+            return fail("Falha ao buscar a estrutura do repositório. Verifique a URL, a branch, o token do GitHub (se privado) e sua conexão.")
+
+        update_progress(0.5, "Estrutura do repositório obtida.")
+
+        if not generator.analyze_repository():
+             job["warnings"].append("Análise inicial do repositório concluída, mas pode haver poucos dados.")
+             # Não paramos aqui, tentamos gerar mesmo assim
+        update_progress(0.6, "Análise inicial concluída.")
+
+        # --- Etapa 2: roteiro com a IA (os trechos vão para job['script_chunks'] enquanto chegam) ---
+        try:
+            podcast_script = generator.generate_podcast_script(progress_callback=update_progress, stream_callback=job["script_chunks"].append)
+        except _load_generator_module().PodcastGenerationError as e:
+            return fail("Falha ao gerar o roteiro do podcast. Verifique os logs.", detail=str(e))
+        update_progress(0.9, "Roteiro gerado!")
+
+        # --- Etapa 3: áudio com vinhetas ---
+        # Os segmentos chegam um a um: o início do podcast já pode ser ouvido
+        # enquanto o restante do áudio ainda está sendo gerado.
+        audio_segments = []
+        for segment in generator.iter_audio_segments(
+            podcast_script,
+            # vignette_path=st.session_state.get('vignette_file_path', 'background_music.mp3'), # Exemplo se tivesse upload
+            # vignette_duration_ms=st.session_state.get('vignette_duration', 5000), # Exemplo se tivesse input
+            progress_callback=update_progress
+        ):
+            audio_segments.append(segment)
+            # Vinheta de abertura + primeira fala já formam uma prévia útil
+            if len(audio_segments) == 2:
+                preview_fp, audio_format = generator.export_audio(audio_segments[0] + audio_segments[1], audio_format)
+                job["preview_audio"] = preview_fp.getvalue()
+                job["audio_format"] = audio_format # Pode ter voltado para MP3
+
+        podcast_audio_bytes, audio_format = generator.combine_audio_segments(audio_segments, progress_callback=update_progress, audio_format=audio_format)
+        if not podcast_audio_bytes:
+            return fail(
+                "Falha ao gerar o áudio do podcast com vinhetas. Verifique os logs.",
+                hint="ℹ️ Dica: Verifique se o arquivo de música para a vinheta existe (`background_music.mp3` por padrão) e se o `ffmpeg` está instalado."
+            )
+
+        finish("done", result={"audio": podcast_audio_bytes, "audio_format": audio_format, "script": podcast_script, "repo_name": generator.repo_name})
+
+    except _PipelineCancelled:
+        finish("cancelled")
+    except Exception as e:
+        fail(f"Ocorreu um erro inesperado durante o processo: {e}", detail=traceback.format_exc()) # Log completo do erro
+
+
+def _store_results(result):
+    """Guarda o resultado na sessão (sobrevive a reruns, sem gerar de novo)."""
+    # Nome do arquivo para download
+    safe_repo_name = result["repo_name"].translate(_SAFE_NAME_TABLE)
+    audio_spec = _load_generator_module().AUDIO_FORMATS[result["audio_format"]]
+    # O áudio vai para um arquivo temporário: o player serve o arquivo em vez de
+    # reenviar os bytes ao navegador a cada rerun
+    with tempfile.NamedTemporaryFile(suffix=f".{audio_spec['extension']}", delete=False) as audio_file:
+        audio_file.write(result["audio"].getbuffer())
+    previous_audio_path = st.session_state.get("audio_path")
+    if previous_audio_path and os.path.exists(previous_audio_path):
+        os.remove(previous_audio_path) # Descarta o podcast anterior desta sessão
+    st.session_state["audio_path"] = audio_file.name
+    st.session_state["script"] = result["script"]
+    st.session_state["script_bytes"] = result["script"].encode('utf-8') # Codificado uma única vez
+    st.session_state["audio_filename"] = f"{safe_repo_name}_podcast.{audio_spec['extension']}"
+    st.session_state["audio_mime"] = audio_spec["mime"]
+    st.session_state["script_filename"] = f"{safe_repo_name}_roteiro.md"
+
+
+def _render_job(job):
+    """Desenha o estado atual do pipeline (progresso, prévias, logs) a partir de `job`."""
+    # Consome o progresso publicado pela thread desde o último rerun
+    while True:
+        try:
+            percentage, message = job["queue"].get_nowait()
+        except queue.Empty:
+            break
+        job["progress"] = (percentage, message)
+        job["log"].write(message + "\n") # Logs acumulados; materializados só na renderização
+
+    percentage, message = job["progress"]
+    for warning in job["warnings"]:
+        st.warning(warning)
+
+    if job["state"] == "running":
+        st.progress(percentage, text=message)
+        # Um único painel de status acompanha todas as etapas
+        st.status(message, state="running", expanded=False)
+        if st.button("⏹️ Parar", key="cancel_job"):
+            job["cancel"].set()
+        if job["preview_audio"]:
+            st.caption("🎧 Prévia do início do podcast (o áudio completo ainda está sendo gerado):")
+            st.audio(job["preview_audio"], format=_load_generator_module().AUDIO_FORMATS[job["audio_format"]]["mime"])
+        elif job["script_chunks"]:
+            # Mostra o roteiro sendo escrito pela IA enquanto os trechos chegam
+            st.code(''.join(job["script_chunks"]), language="markdown")
+        time.sleep(0.5)
+        st.rerun()
+
+    # --- Estado final ---
+    if job["state"] == "done":
+        if not job.get("stored"):
+            _store_results(job.pop("result"))
+            job["stored"] = True
+        st.success("Podcast gerado com sucesso! 🎉")
+        status = st.status("Processo concluído com sucesso.", state="complete", expanded=False)
+    elif job["state"] == "cancelled":
+        st.info("Geração interrompida pelo usuário.")
+        status = st.status("Geração cancelada.", state="error", expanded=False)
+    else:
+        st.error(job["error"])
+        if job.get("hint"):
+            st.info(job["hint"])
+        status = st.status("Falha na geração do podcast.", state="error", expanded=False)
+    status.text(job["log"].getvalue()) # Mostra logs mesmo em erro
+    if job.get("detail"):
+        status.error(job["detail"])
+
+
 # --- Lógica Principal ---
 st.header("Resultado da Geração")
 
-if st.sidebar.button("Gerar Podcast!", use_container_width=True, type="primary"):
+job = st.session_state.get("job")
+job_running = job is not None and job["state"] == "running"
+
+if st.sidebar.button("Gerar Podcast!", use_container_width=True, type="primary", disabled=job_running):
     if not gemini_api_key:
         st.warning("Por favor, insira sua API Key da Google Gemini na barra lateral.")
     elif not repo_url:
@@ -85,116 +331,63 @@ if st.sidebar.button("Gerar Podcast!", use_container_width=True, type="primary")
     else:
         # Inicializa o gerador (pode mostrar erro e parar aqui se a chave for inválida na inicialização)
         try:
-            generator = get_generator(gemini_api_key, github_token)
-        except Exception as e: # Captura erro se get_generator falhar e parar
-             # A mensagem de erro já foi mostrada por get_generator
+            generator = new_generator(gemini_api_key, github_token, elevenlabs_api_key) # Instância só desta execução
+            generator.tts_provider = tts_provider
+            generator.tts_streaming_latency = tts_streaming_latency
+        except Exception as e: # Captura erro se new_generator falhar e parar
+             # A mensagem de erro já foi mostrada por new_generator
              st.stop()
 
-
-        # Placeholder para o progresso e logs
-        progress_bar = st.progress(0, text="Iniciando...")
-        log_area = st.expander("Logs Detalhados", expanded=False)
-        log_messages = []
-
-        def update_progress(percentage, message):
-            """Função de callback para atualizar a barra de progresso e logs."""
-            progress_bar.progress(percentage, text=message)
-            log_messages.append(message)
-            # Atualiza a área de logs dinamicamente (pode causar re-render completo)
-            # log_area.text("\n".join(log_messages)) # Comentado pois pode ser lento
-            print(f"Progresso: {int(percentage*100)}% - {message}") # Log no console também
-
-        try:
-            with st.spinner("Analisando URL e buscando repositório..."):
-                 if not generator.parse_github_url(repo_url):
-                     st.error("Não foi possível analisar a URL do GitHub. Verifique a URL e tente novamente.")
-                     st.stop()
-
-                 update_progress(0.1, f"Analisando {generator.repo_owner}/{generator.repo_name}...")
-
-                 if not generator.fetch_repo_structure(progress_callback=update_progress):
-                     st.error("Falha ao buscar a estrutura do repositório. Verifique a URL, a branch, o token do GitHub (se privado) e sua conexão.")
-                     st.stop()
-
-                 update_progress(0.5, "Estrutura do repositório obtida.")
-
-                 if not generator.analyze_repository():
-                      st.warning("Análise inicial do repositório concluída, mas pode haver poucos dados.")
-                      # Não paramos aqui, tentamos gerar mesmo assim
-                 update_progress(0.6, "Análise inicial concluída.")
-
-
-            with st.spinner("Gerando roteiro do podcast com a IA... (Pode levar um tempo)"):
-                 podcast_script = generator.generate_podcast_script(progress_callback=update_progress)
-                 if not podcast_script or "Erro:" in podcast_script:
-                      st.error(f"Falha ao gerar o roteiro do podcast. Verifique os logs.")
-                      log_area.error(podcast_script) # Mostra erro no log
-                      st.stop()
-                 update_progress(0.9, "Roteiro gerado!")
-
-            with st.spinner("Gerando áudio do podcast com vinhetas..."):
-                 # A chamada continua simples, mas agora passará pelos novos parâmetros padrão
-                 # ou você pode adicionar inputs para vignette_path e vignette_duration_ms
-                 podcast_audio_bytes = generator.generate_podcast_audio(
-                     podcast_script,
-                     # vignette_path=st.session_state.get('vignette_file_path', 'background_music.mp3'), # Exemplo se tivesse upload
-                     # vignette_duration_ms=st.session_state.get('vignette_duration', 5000), # Exemplo se tivesse input
-                     progress_callback=update_progress
-                 )
-
-                 if not podcast_audio_bytes:
-                     st.error("Falha ao gerar o áudio do podcast com vinhetas. Verifique os logs.")
-                     log_area.text("\n".join(log_messages))
-                     st.info("ℹ️ Dica: Verifique se o arquivo de música para a vinheta existe (`background_music.mp3` por padrão) e se o `ffmpeg` está instalado.")
-                     st.stop()
-
-            # --- Exibe os Resultados ---
-            st.success("Podcast gerado com sucesso! 🎉")
-            # Nome do arquivo para download
-            safe_repo_name = re.sub(r'[^\w\-]+', '_', generator.repo_name)
-            audio_filename = f"{safe_repo_name}_podcast.mp3"
-            script_filename = f"{safe_repo_name}_roteiro.md"
-
-            # Player de Áudio
-            st.subheader("🎧 Ouça o Podcast:")
-            st.audio(podcast_audio_bytes, format="audio/mp3")
-
-            # Botão de Download do Áudio
-            st.download_button(
-                label="⬇️ Baixar Áudio (MP3)",
-                data=podcast_audio_bytes,
-                file_name=audio_filename,
-                mime="audio/mp3",
-                use_container_width=True
-            )
-
-            # Exibir e permitir download do roteiro
-            st.subheader("📜 Roteiro Gerado:")
-            st.markdown(f"```markdown\n{podcast_script}\n```") # Usar markdown para melhor formatação
-            # st.text_area("Roteiro:", podcast_script, height=400) # Alternativa com text_area
-
-            st.download_button(
-                label="⬇️ Baixar Roteiro (MD)",
-                data=podcast_script.encode('utf-8'), # Codifica para bytes
-                file_name=script_filename,
-                mime="text/markdown",
-                use_container_width=True
-            )
-
-            # Atualiza logs finais
-            log_area.text("\n".join(log_messages))
-            log_area.success("Processo concluído com sucesso.")
-
-
-        except Exception as e:
-            st.error(f"Ocorreu um erro inesperado durante o processo: {e}")
-            log_messages.append(f"ERRO INESPERADO: {e}")
-            log_area.text("\n".join(log_messages)) # Mostra logs mesmo em erro
-            import traceback
-            log_area.text(traceback.format_exc()) # Log completo do erro
+        job = {
+            "state": "running",
+            "queue": queue.Queue(),
+            "cancel": threading.Event(),
+            "progress": (0.0, "Iniciando..."),
+            "log": io.StringIO(),
+            "warnings": [],
+            "script_chunks": [],
+            "preview_audio": None,
+            "audio_format": audio_format,
+        }
+        st.session_state["job"] = job
+        threading.Thread(target=_run_pipeline, args=(generator, repo_url, audio_format, job), daemon=True).start()
+
+if job is not None:
+    _render_job(job)
+
+
+# --- Exibe os Resultados (da sessão, sobrevivem a reruns) ---
+if "audio_path" in st.session_state and os.path.exists(st.session_state["audio_path"]):
+    # Player de Áudio
+    st.subheader("🎧 Ouça o Podcast:")
+    st.audio(st.session_state["audio_path"], format=st.session_state["audio_mime"])
+
+    # Botão de Download do Áudio
+    with open(st.session_state["audio_path"], "rb") as audio_file:
+        st.download_button(
+            label=f"⬇️ Baixar Áudio ({st.session_state['audio_filename'].rsplit('.', 1)[-1].upper()})",
+            data=audio_file,
+            file_name=st.session_state["audio_filename"],
+            mime=st.session_state["audio_mime"],
+            use_container_width=True
+        )
+
+    # Exibir e permitir download do roteiro
+    st.subheader("📜 Roteiro Gerado:")
+    # st.code é mais leve que um bloco markdown; o expander recolhido adia a renderização
+    with st.expander("Ver roteiro", expanded=False):
+        st.code(st.session_state["script"], language="markdown")
+
+    st.download_button(
+        label="⬇️ Baixar Roteiro (MD)",
+        data=st.session_state["script_bytes"],
+        file_name=st.session_state["script_filename"],
+        mime="text/markdown",
+        use_container_width=True
+    )
 
 
 # --- Rodapé ou Informações Adicionais ---
 st.markdown("---")
-st.markdown("Desenvolvido com Streamlit, Google Gemini e gTTS.")
+st.markdown("Desenvolvido com Streamlit, Google Gemini e gTTS/Edge TTS/ElevenLabs.")
 st.markdown("Repositório no GitHub: [link-para-seu-repo-se-quiser]") # Adicione o link do seu projeto aqui
\ No newline at end of file
@@ -1,19 +1,41 @@
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import os
 import base64
 import textwrap
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
 import time
+import random
 from pathlib import Path
 import json
+import hashlib
+import gzip
+import tarfile
 from tqdm import tqdm
 import io
 import google.generativeai as genai
-from gtts import gTTS
+from gtts import gTTS, gTTSError
 from dotenv import load_dotenv
 from pydub import AudioSegment
+from pydub.silence import detect_leading_silence
 import math # Importado para usar log
+import datetime
+import asyncio
+import functools
+import contextlib
+import threading
+import traceback
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import orjson # Opcional: serialização bem mais rápida do payload enviado à IA
+except ImportError:
+    orjson = None
+try:
+    import edge_tts # Opcional: provedor de TTS 'edge' (vozes neurais da Microsoft, sem chave)
+except ImportError:
+    edge_tts = None
 
 # Carrega variáveis de ambiente do .env (se existir)
 load_dotenv()
@@ -27,22 +49,141 @@ COMPLEXITY_THRESHOLD_FILES_HIGH = 600       # Mais que isso, provavelmente compl
 COMPLEXITY_THRESHOLD_LANGS_HIGH = 5         # Mais que isso, contribui para complexidade
 # ---------------------------------------------------------
 
-class GitHubPodcastGenerator:
+# Formatos de exportação do podcast. A fala do gTTS já vem em ~32 kbps mono, então bitrates
+# maiores só aumentam o arquivo. Opus rende ~1/3 dos bytes, mas depende do ffmpeg com libopus.
+AUDIO_FORMATS = {
+    "mp3": {"format": "mp3", "codec": None, "bitrate": "64k", "mime": "audio/mpeg", "extension": "mp3"},
+    "opus": {"format": "ogg", "codec": "libopus", "bitrate": "24k", "mime": "audio/ogg", "extension": "ogg"},
+}
+
+# Decodificador do ffmpeg para as falas (gTTS/ElevenLabs) e a vinheta, que são sempre MP3. Com o codec
+# explícito o Pydub pula o ffprobe: um subprocesso a menos por trecho, com o mesmo PCM do decodificador padrão.
+MP3_DECODER = "mp3float"
+
+# Serializador dos dados enviados à IA: JSON compacto, sem escapes \uXXXX. Criado uma única vez
+# (json.dumps com argumentos não padrão monta um encoder novo a cada chamada).
+AI_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+# --- Expressões regulares (compiladas uma única vez) ---
+# README: título H1, badges, blocos <p align="center"> e primeira descrição
+README_TITLE_RE = re.compile(r'^#\s+(.*?)\n', re.MULTILINE)
+README_LEADING_TITLE_RE = re.compile(r'^#\s+.*?\n') # Só o primeiro H1, no início do texto
+README_BADGE_RE = re.compile(r'^\[!\[.*?\]\(.*?\)\]\(.*?\)\s*?\n?', re.MULTILINE)
+README_CENTERED_BLOCK_RE = re.compile(r'^\<p align="center"\>.*?\</p\>\s*', re.IGNORECASE | re.DOTALL)
+README_DESCRIPTION_RE = re.compile(r'^\s*(.+?)\n(\n|\s*#|$)', re.DOTALL | re.MULTILINE)
+# A descrição sai do começo do README: a limpeza só percorre este trecho inicial (caracteres)
+README_SUMMARY_WINDOW = 20000
+# Roteiro: marcadores entre colchetes e limpeza de texto para o TTS
+SCRIPT_MARKER_RE = re.compile(r'(\[.*?\])')
+SCRIPT_FOOTER_RE = re.compile(r'---\n.*', re.DOTALL)
+TTS_SPEAKER_RE = re.compile(r'^\s*(\*\*)*(LOCUTOR:|HOST:)(\*\*)*\s*', re.IGNORECASE | re.MULTILINE)
+TTS_EMPHASIS_RE = re.compile(r'\*(\*?)(.*?)\1\*')
+TTS_HEADING_RE = re.compile(r'^\s*#+\s+', re.MULTILINE)
+TTS_LIST_BULLET_RE = re.compile(r'^\s*[-*+]\s+', re.MULTILINE)
+TTS_LINK_RE = re.compile(r'\[(.*?)\]\(.*?\)')
+TTS_WHITESPACE_RE = re.compile(r'\s+')
+TTS_SPACE_BEFORE_PUNCT_RE = re.compile(r'\s([?.!,:])')
+# Fim de frase (pontuação seguida de espaço), usado para dividir a fala entre as chamadas ao TTS
+SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+')
+# Áudio (base64) dentro da resposta batchexecute do Google Tradutor, como o gTTS o extrai
+GTTS_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+# Marcadores do roteiro que inserem a vinheta (se carregada)
+VIGNETTE_MARKERS = frozenset([
+    '[VINHETA DE ABERTURA]',
+    '[VINHETA DE TRANSIÇÃO]',
+    '[VINHETA DE ENCERRAMENTO]',
+])
+# Marcadores que devem ser REMOVIDOS do texto falado
+MARKERS_TO_REMOVE = VIGNETTE_MARKERS | {
+    '[MÚSICA SUAVE DE FUNDO]', # Exemplo de outros marcadores a remover
+    '[SECTION BREAK]',
+}
+# Dependências vendorizadas, builds e bundles minificados: ocupam a cota de leitura sem explicar o projeto
+GENERATED_PATH_RE = re.compile(r'(?:^|/)(?:node_modules|vendor|dist|build)/|\.min\.(?:js|css)$', re.IGNORECASE)
+# Extensões em que uma linha enorme no início indica arquivo minificado/gerado
+MINIFIABLE_EXTENSIONS = frozenset(['.js', '.css', '.html', '.json', '.xml'])
+# Espaços sem significado no código enviado à IA: fim de linha (inclui \r do CRLF) e linhas em branco repetidas
+TRAILING_WHITESPACE_RE = re.compile(r'[ \t\r]+$', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+# --- Heurística de arquivos chave ---
+# Patterns melhorados e expandidos. A ordem importa: vale o primeiro tipo/termo que casar.
+KEY_FILE_PATTERNS = {
+    'config': ['config', 'settings', 'conf', 'manifest', 'values.yaml', 'chart.yaml', '.env', 'env.', 'properties', 'application.yml', 'bootstrap.yml', 'appsettings.json'],
+    'entry': ['main', 'app', 'index', 'server', 'run', '__main__', 'wsgi', 'asgi', 'program.cs', 'startup.cs'],
+    'build': ['package.json', 'requirements.txt', 'pom.xml', 'build.gradle', 'dockerfile', 'makefile', 'setup.py', 'go.mod', 'cargo.toml', 'composer.json', '.csproj', '.sln', 'rakefile'],
+    'docs': ['contributing.md', 'license', 'code_of_conduct.md', 'changelog.md', 'readme.md'], # Adicionado readme aqui também
+    'test': ['test_', '_test', '.spec.', '.test.'], # Mantido simples
+    'workflow': ['.github/workflows', '.gitlab-ci.yml', 'azure-pipelines.yml', 'jenkinsfile'],
+    'ui_framework_config': ['vite.config.', 'webpack.config.', 'next.config.', 'nuxt.config.', 'tailwind.config.', 'postcss.config.'],
+    'orm_migration': ['migration', 'alembic', 'prisma/schema.prisma'],
+    'routing': ['routes.', 'urls.py', 'controller', 'handler'],
+}
+# Tipos que também casam quando o termo aparece em qualquer parte do path
+KEY_FILE_PATH_TYPES = ('workflow', 'test', 'routing', 'orm_migration')
+# Índices pré-calculados: {termo: (ordem, tipo)} para casar prefixos do nome com poucas
+# consultas a dict (uma por tamanho de termo), e a lista curta de termos buscados no path
+KEY_FILE_PREFIX_INDEX = {}
+KEY_FILE_PATH_TERMS = []
+for _order, (_type, _term) in enumerate((t, term) for t, terms in KEY_FILE_PATTERNS.items() for term in terms):
+    KEY_FILE_PREFIX_INDEX.setdefault(_term, (_order, _type))
+    if _type in KEY_FILE_PATH_TYPES:
+        KEY_FILE_PATH_TERMS.append((_order, _type, _term))
+KEY_FILE_PREFIX_LENGTHS = sorted({len(term) for term in KEY_FILE_PREFIX_INDEX})
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+# Cache em disco (blobs do GitHub, etc.). Pode ser trocado pela variável PODCASTGIT_CACHE_DIR.
+CACHE_DIR = Path(os.getenv("PODCASTGIT_CACHE_DIR") or Path.home() / ".cache" / "podcastgit")
+
+# Roteiro de exemplo usado quando a geração com a IA falha (preenchido em _generate_stub_podcast_script)
+STUB_SCRIPT_TEMPLATE = """
+        [VINHETA DE ABERTURA]
+
+        LOCUTOR: Olá! Bem-vindos ao Explica Código! Infelizmente, hoje encontramos um problema técnico ao tentar gerar a análise detalhada do repositório{model_name_mention}. A mensagem de erro foi: "{error_message}".
+
+        LOCUTOR: Mesmo sem a análise da IA, vamos dar uma olhada nas informações básicas que conseguimos coletar.
+
+        [VINHETA DE TRANSIÇÃO]
+
+        LOCUTOR: O repositório que íamos explorar é o '{repo_title}', mantido por '{repo_owner_name}'. Pelo que vimos, ele parece ser escrito principalmente em '{main_language}'.
+
+        LOCUTOR: A descrição que encontramos sugere que o objetivo do projeto é: {repo_desc}
+
+        LOCUTOR: Como não conseguimos gerar o roteiro completo, a dica de hoje é mais genérica: ao explorar um novo repositório, sempre comece pelo README.md! Ele geralmente contém a visão geral, instruções de instalação e uso.
+
+        LOCUTOR: Depois do README, procure por arquivos de configuração (como 'package.json', 'requirements.txt', 'pom.xml'), arquivos de ponto de entrada (como 'main.py', 'index.js', 'Program.cs') e a estrutura geral de pastas (como 'src', 'app', 'lib', 'tests', 'docs').
+
+        LOCUTOR: Pedimos desculpas por não termos o episódio completo hoje. Recomendamos que você mesmo navegue pelo repositório no link que deixaremos na descrição, caso ele esteja disponível: {repo_link}
+
+        [VINHETA DE ENCERRAMENTO]
+        ---
+        Roteiro de exemplo gerado devido a erro.
+        Repositório: {repo_link}
+        Erro: {error_message}
+        """
+
+
+class PodcastGenerationError(Exception):
     """
-    Ferramenta para gerar podcasts didáticos em áudio explicando repositórios do GitHub,
-    focando em desenvolvedores juniores, usando a API Gemini e gTTS.
-    Versão adaptada para um modelo hipotético de contexto longo (ex: 1M tokens).
-    Adapta o nível de detalhe do podcast com base na complexidade estimada do repositório.
+    Falha ao gerar o roteiro do podcast.
+    `fallback_script` traz um roteiro de exemplo (com o erro explicado) para quem quiser usá-lo.
     """
 
-    def __init__(self, gemini_api_key=None, github_token=None):
-        """
-        Inicializa o gerador de podcast.
+    def __init__(self, message, fallback_script=None):
+        super().__init__(message)
+        self.fallback_script = fallback_script
 
-        Args:
-            gemini_api_key (str, optional): Sua chave da API Gemini. Tenta obter do ambiente se não fornecida.
-            github_token (str, optional): Seu token do GitHub. Tenta obter do ambiente se não fornecido.
-        """
+
+class GeneratorClients:
+    """
+    Clientes reaproveitáveis entre execuções: configuração da Gemini, sessões HTTP (keep-alive +
+    pool de conexões) e caches em memória que não dependem do repositório em análise (estruturas
+    por commit, caches de contexto e arquivos da Gemini). Não guarda estado de uma execução, então
+    pode ser compartilhado entre geradores rodando ao mesmo tempo (ex: sessões do Streamlit);
+    cada execução usa seu próprio GitHubPodcastGenerator.
+    """
+
+    def __init__(self, gemini_api_key=None, github_token=None, tts_pool_size=8):
         self.gemini_api_key = gemini_api_key or os.getenv("GOOGLE_API_KEY")
         self.github_token = github_token or os.getenv("GITHUB_TOKEN")
 
@@ -58,6 +199,61 @@ class GitHubPodcastGenerator:
                 print(f"Erro ao configurar a API Gemini: {e}")
                 self.gemini_api_key = None # Invalida se falhar
 
+        # --- Sessão HTTP do GitHub ---
+        # pool_maxsize acima de max_github_workers: leituras paralelas nunca esperam por conexão
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+        if self.github_token:
+            self.session.headers["Authorization"] = f"token {self.github_token}"
+            print("✓ Token do GitHub encontrado.")
+        else:
+            print("⚠️ Token do GitHub não encontrado. Repositórios privados ou com alto tráfego podem falhar.")
+        # Sessão própria para TTS: a sessão do GitHub carrega o token no cabeçalho Authorization
+        self.tts_session = requests.Session()
+        self.tts_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=tts_pool_size))
+
+        # --- Caches compartilhados (acesso sempre com `lock`) ---
+        self.lock = threading.Lock()
+        # Estruturas lidas, chaveadas por (owner, repo, commit SHA). Um novo commit
+        # gera uma nova chave, então a invalidação é exata.
+        self.structures = OrderedDict()
+        self.context_caches = {} # {sha256 dos dados: (CachedContent, expira_em)}
+        self.uploaded_payloads = {} # {sha256 dos dados: (File, expira_em)}
+        self._gemini_models = {}
+
+    def gemini_model(self, model_name):
+        """GenerativeModel para o nome dado, criado uma vez por processo."""
+        with self.lock:
+            if model_name not in self._gemini_models:
+                self._gemini_models[model_name] = genai.GenerativeModel(model_name)
+            return self._gemini_models[model_name]
+
+
+class GitHubPodcastGenerator:
+    """
+    Ferramenta para gerar podcasts didáticos em áudio explicando repositórios do GitHub,
+    focando em desenvolvedores juniores, usando a API Gemini e gTTS.
+    Versão adaptada para um modelo hipotético de contexto longo (ex: 1M tokens).
+    Adapta o nível de detalhe do podcast com base na complexidade estimada do repositório.
+    """
+
+    def __init__(self, gemini_api_key=None, github_token=None, clients=None, elevenlabs_api_key=None):
+        """
+        Inicializa o gerador de podcast.
+
+        Args:
+            gemini_api_key (str, optional): Sua chave da API Gemini. Tenta obter do ambiente se não fornecida.
+            github_token (str, optional): Seu token do GitHub. Tenta obter do ambiente se não fornecido.
+            clients (GeneratorClients, optional): Clientes compartilhados entre execuções. Se dados,
+                as chaves vêm deles (e os dois argumentos acima são ignorados).
+            elevenlabs_api_key (str, optional): Chave da ElevenLabs só desta instância (nunca vai para
+                os clientes compartilhados). Tenta obter do ambiente se não fornecida.
+        """
+        # Clientes (Gemini, sessões HTTP) podem ser compartilhados; o restante do estado é desta instância
+        self.clients = clients or GeneratorClients(gemini_api_key=gemini_api_key, github_token=github_token)
+        self.gemini_api_key = self.clients.gemini_api_key
+        self.github_token = self.clients.github_token
+
         # --- ALTERAÇÃO: Nome do modelo hipotético ---
         #self.gemini_model_name = 'gemini-1.5-pro-preview-0409' # Exemplo de modelo real
         self.gemini_model_name = 'gemini-2.5-pro-exp-03-25' # Modelo mais rápido e recente (Preview)
@@ -65,12 +261,11 @@ class GitHubPodcastGenerator:
         self._log_message(f"Usando modelo Gemini: {self.gemini_model_name}", "info")
         # ----------------------------------------------
 
-        self.headers = {}
-        if self.github_token:
-            self.headers = {"Authorization": f"token {self.github_token}"}
-            print("✓ Token do GitHub encontrado.")
-        else:
-            print("⚠️ Token do GitHub não encontrado. Repositórios privados ou com alto tráfego podem falhar.")
+        self.headers = {"Authorization": f"token {self.github_token}"} if self.github_token else {}
+
+        # --- Sessão HTTP reutilizável (keep-alive + pool de conexões), vinda dos clientes ---
+        self.session = self.clients.session
+        # ----------------------------------------------------------------
 
         # Detalhes do repositório
         self.repo_owner = None
@@ -87,6 +282,11 @@ class GitHubPodcastGenerator:
         self.repo_summary = {}
         self.complexity_level = 'medium' # Nível de complexidade padrão
         self.total_code_chars_collected = 0 # Armazena o total de caracteres de código lidos
+        self.commit_sha = None # SHA do commit analisado (resolvido a partir da branch)
+        # Estatísticas por arquivo, acumuladas durante a própria leitura da árvore (evita novas passadas)
+        self.language_counts = Counter()
+        self.files_with_content_count = 0
+        self._prefetched_readme = None # README obtido em parse_github_url junto com a branch padrão
 
         self.generation_config = genai.types.GenerationConfig(
             candidate_count=1,
@@ -107,6 +307,11 @@ class GitHubPodcastGenerator:
         self.max_files_to_read_content = 1500 # Aumentado um pouco
         # Limite alto por arquivo (ex: ~150k caracteres)
         self.max_chars_per_file_read = 150000 # Aumentado
+        # Arquivos maiores que isso (bytes, conforme o `size` da árvore) nem são baixados:
+        # costumam ser gerados/minificados e seriam truncados de qualquer forma
+        self.max_file_bytes_to_read = 200000
+        # Linha mais longa aceita entre as primeiras 20 de js/css/html/json/xml; acima disso é minificado
+        self.max_minified_line_chars = 500
         # Limite para o README enviado à IA (ex: ~300k caracteres)
         self.max_readme_chars_for_ai = 300000 # Aumentado
         # Limite TOTAL de caracteres de CÓDIGO a serem enviados à IA (ex: 5 Milhões para Flash, pode ir mais pro Pro 1.5)
@@ -114,14 +319,293 @@ class GitHubPodcastGenerator:
         self.max_total_code_chars_for_ai = 5000000 # AUMENTADO SIGNIFICATIVAMENTE
         # Limite para a lista de nomes de arquivos enviada à IA
         self.max_file_list_for_ai = 3000 # Aumentado
+        # Número de requisições simultâneas à API do GitHub (não exceder o pool da sessão)
+        self.max_github_workers = 16
+        # Timeout (segundos) das requisições HTTP; sem ele, uma conexão presa trava a geração
+        self.request_timeout = 10
+        # Novas tentativas em falhas transitórias (5xx, conexão) e limite de taxa do GitHub
+        self.github_max_retries = 5
+        self.github_backoff_base = 1.0 # Segundos; dobra a cada tentativa (+ jitter)
+        self.github_backoff_cap = 30
+        # Espera máxima pelo reset do limite de taxa; acima disso, falha logo em vez de travar a UI
+        self.max_rate_limit_wait = 60
+        # Com menos requisições restantes que isso, espera o reset (se próximo) antes de continuar
+        self.rate_limit_floor = 50
+        # Novas tentativas quando Gemini ou TTS respondem 429 (cota compartilhada), com o mesmo backoff do GitHub
+        self.api_rate_limit_retries = 4
+        # Arquivos lidos por consulta GraphQL (um alias `object(expression:)` por arquivo)
+        self.graphql_batch_size = 50
+        # Sem GraphQL (sem token ou falha), muitos arquivos a baixar vêm do tarball do commit numa
+        # requisição só, se o repositório inteiro (soma dos blobs da árvore) couber no limite
+        self.tarball_min_files = 100
+        self.max_tarball_bytes = 50 * 1024 * 1024
+        # Número de chamadas simultâneas ao gTTS na geração de áudio (o pool do tts_session tem o mesmo tamanho)
+        self.max_tts_workers = 8
+        # Tamanho máximo (caracteres) de cada trecho enviado ao TTS: blocos longos são
+        # quebrados em frases e agrupados até esse limite, para sintetizar em paralelo
+        self.tts_chunk_chars = 400
+        # Intervalo mínimo (segundos) entre atualizações de progresso por item; cada uma redesenha a UI
+        self.progress_update_interval = 0.1
+        # Quantas estruturas de repositório (por commit) manter em memória
+        self.max_cached_structures = 8
+        # Cache de conteúdo de blobs em disco (o conteúdo de um SHA nunca muda)
+        self.blob_cache_dir = CACHE_DIR / "blobs"
+        self.max_blob_cache_bytes = 200 * 1024 * 1024
+        self.blob_cache_prune_every = 200 # Gravações entre cada verificação de tamanho
+        self._blob_cache_writes = 0
+        # Estruturas lidas (por commit) também vão para o disco: sobrevivem a reinícios do app
+        self.structure_cache_dir = CACHE_DIR / "repo"
+        self.max_structure_cache_bytes = 200 * 1024 * 1024
+        # Cache de roteiros gerados, chaveado pelo hash de modelo + prompt + dados enviados
+        self.script_cache_enabled = True
+        self.script_cache_dir = CACHE_DIR / "scripts"
+        self.script_cache_ttl_seconds = 7 * 24 * 3600
+        # ETags das chamadas leves (branch padrão, SHA do HEAD, README) também vão para o disco:
+        # depois de reiniciar o app, a primeira consulta já pode ser um 304
+        self.etag_cache_dir = CACHE_DIR / "etags"
+        self.max_etag_cache_bytes = 20 * 1024 * 1024
+        # Cache de contexto explícito da Gemini para os dados do repo (desconto nos tokens
+        # reaproveitados, ex: ao tentar de novo após um erro). Abaixo do mínimo de tokens a
+        # API recusa criar o cache, então nem tentamos.
+        self.use_context_cache = True
+        self.context_cache_ttl_seconds = 600
+        self.min_context_cache_tokens = 2048
+        self._context_caches = self.clients.context_caches # Compartilhado: {sha256 dos dados: (CachedContent, expira_em)}
+        # Sem cache de contexto, payloads grandes vão pela Files API: enviados uma vez e
+        # referenciados pelo handle nas próximas gerações (arquivos expiram em 48h)
+        self.use_files_api = True
+        self.min_files_api_chars = 1000000
+        self.files_api_ttl_seconds = 47 * 3600 # Margem antes da expiração no servidor
+        self._uploaded_payloads = self.clients.uploaded_payloads # Compartilhado: {sha256 dos dados: (File, expira_em)}
         # -------------------------------------------------------------------
 
+        # Cache da estrutura lida, chaveado por (owner, repo, commit SHA), compartilhado pelos
+        # clientes. Não é limpo por reset().
+        self._structure_cache = self.clients.structures
+        # ETags das chamadas leves (persist_etag) da API do GitHub: {(url, accept): (etag, resposta)}.
+        # Requisições repetidas usam If-None-Match e, num 304, reaproveitam o corpo guardado.
+        # Arquivos, blobs e a árvore não entram aqui, para a memória não crescer com o repositório.
+        self._etag_cache = {}
+
+        # --- Provedores de TTS ---
+        # 'gtts' (padrão, gratuito), 'edge' (gratuito, sem limite por minuto; requer o pacote edge-tts)
+        # ou 'elevenlabs' (streaming, menor latência; requer chave).
+        self.tts_backends = {"gtts": self._tts_gtts, "edge": self._tts_edge, "elevenlabs": self._tts_elevenlabs}
+        # Provedor, chave da ElevenLabs e latência são por execução: reset() volta aos valores abaixo
+        self._elevenlabs_api_key_arg = elevenlabs_api_key
+        self._reset_tts_settings()
+        self.elevenlabs_voice_id = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+        self.elevenlabs_model_id = "eleven_multilingual_v2"
+        self.edge_tts_voice = os.getenv("EDGE_TTS_VOICE", "pt-BR-AntonioNeural") # A voz define o idioma
+        # Formato padrão do áudio final (chave de AUDIO_FORMATS). As exportações recebem o formato
+        # por chamada e devolvem o efetivo (MP3 se o Opus falhar); este valor nunca é alterado.
+        self.audio_format = "mp3"
+        # Sessão própria para TTS (dos clientes): a sessão do GitHub carrega o token no cabeçalho Authorization
+        self.tts_session = self.clients.tts_session
+        # Cache em disco do áudio de cada trecho (MP3 do provedor), chaveado por provedor, voz e texto:
+        # gerar de novo o mesmo roteiro (ou falas repetidas entre roteiros) não refaz as requisições
+        self.tts_cache_enabled = True
+        self.tts_cache_dir = CACHE_DIR / "tts"
+        self.max_tts_cache_bytes = 200 * 1024 * 1024
+        self.tts_cache_prune_every = 50 # Gravações entre cada verificação de tamanho
+        self._tts_cache_writes = 0
+
 
     def _log_message(self, message, level="info"):
         """Helper para logar mensagens."""
         prefix = {"info": "ℹ️", "warning": "⚠️", "error": "❌", "success": "✅"}.get(level, "➡️")
         print(f"{prefix} {message}")
 
+    def _throttle_progress(self, progress_callback):
+        """Envolve o callback para repassar no máximo uma atualização por intervalo (e sempre a final)."""
+        if progress_callback is None:
+            return None
+        last_update = [0.0]
+        def report(fraction, message, final=False):
+            now = time.monotonic()
+            if final or now - last_update[0] >= self.progress_update_interval:
+                last_update[0] = now
+                progress_callback(fraction, message)
+        return report
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _worker_pool(max_workers):
+        """
+        ThreadPoolExecutor que, se o bloco sair por exceção (ex: 'Parar' levantado pelo callback
+        de progresso, ou o consumidor abandonando um gerador), descarta as tarefas ainda na fila
+        e espera só as que já estão rodando, em vez de executar todo o backlog.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            yield executor
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+
+    def _github_get(self, api_url, headers=None, persist_etag=False):
+        """
+        GET na API do GitHub pela sessão compartilhada, com requisição condicional via ETag.
+        Só as chamadas com `persist_etag` (respostas pequenas) são guardadas, em memória e no disco;
+        leituras de arquivos e da árvore não ficam retidas.
+        """
+        headers = dict(headers or {})
+        cache_key = (api_url, headers.get("Accept"))
+        cached = None
+        if persist_etag:
+            cached = self._etag_cache.get(cache_key) or self._read_cached_etag(cache_key)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+
+        response = self._github_request("GET", api_url, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1] # Não modificado: corpo já conhecido (e não consome cota com token)
+
+        etag = response.headers.get("ETag")
+        if etag and response.ok and persist_etag:
+            self._etag_cache[cache_key] = (etag, response)
+            self._write_cached_etag(cache_key, etag, response)
+        return response
+
+    def _etag_cache_path(self, cache_key):
+        key_hash = hashlib.sha256("\n".join(part or "" for part in cache_key).encode("utf-8")).hexdigest()
+        return self.etag_cache_dir / f"{key_hash}.json"
+
+    def _read_cached_etag(self, cache_key):
+        """(etag, resposta) salvos em disco para esta URL/Accept, ou None (entradas inválidas são apagadas)."""
+        cache_path = self._etag_cache_path(cache_key)
+        try:
+            entry = json.loads(cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        try:
+            if not (isinstance(entry["status_code"], int) and isinstance(entry["etag"], str)):
+                raise TypeError("status_code/etag com tipo inesperado")
+            response = requests.Response()
+            response.status_code = entry["status_code"]
+            response.url = entry["url"]
+            response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+            response.encoding = "utf-8"
+            response._content = entry["content"].encode("utf-8")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # Formato antigo ou arquivo editado: descarta e segue como se não houvesse ETag
+            try:
+                cache_path.unlink()
+            except OSError:
+                pass
+            return None
+        self._etag_cache[cache_key] = (entry["etag"], response)
+        return self._etag_cache[cache_key]
+
+    def _write_cached_etag(self, cache_key, etag, response):
+        try:
+            content = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            return # Corpo binário: fica só no cache em memória
+        entry = {
+            "etag": etag,
+            "url": response.url,
+            "status_code": response.status_code,
+            "headers": {name: response.headers[name] for name in ("Content-Type", "ETag") if name in response.headers},
+            "content": content,
+        }
+        cache_path = self._etag_cache_path(cache_key)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            tmp_path.write_text(AI_JSON_ENCODER.encode(entry), encoding="utf-8")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self._log_message(f"Não foi possível gravar a ETag no cache em disco ({e}).", "warning")
+            return
+        self._prune_cache_dir(self.etag_cache_dir, "*.json", self.max_etag_cache_bytes)
+
+    def _github_request(self, method, api_url, **kwargs):
+        """Requisição ao GitHub pela sessão, com backoff exponencial em 429/5xx, limite de taxa e erros de conexão."""
+        kwargs.setdefault("timeout", self.request_timeout)
+        for attempt in range(self.github_max_retries + 1):
+            last_attempt = attempt == self.github_max_retries
+            try:
+                response = self.session.request(method, api_url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                wait = self._backoff_delay(attempt)
+                self._log_message(f"Falha de conexão com o GitHub ({e}). Nova tentativa em {wait:.1f}s.", "warning")
+                time.sleep(wait)
+                continue
+
+            wait = self._retry_wait(response, attempt)
+            if wait is None or last_attempt:
+                self._throttle_if_low(response)
+                return response
+            self._log_message(f"GitHub respondeu {response.status_code}. Nova tentativa em {wait:.1f}s ({attempt + 1}/{self.github_max_retries}).", "warning")
+            time.sleep(wait)
+
+    def _throttle_if_low(self, response):
+        """Pausa até o reset do limite de taxa quando restam poucas requisições e o reset está próximo."""
+        try:
+            remaining = int(response.headers.get("X-RateLimit-Remaining", self.rate_limit_floor))
+            reset_in = int(response.headers.get("X-RateLimit-Reset", 0)) - time.time()
+        except ValueError:
+            return
+        if remaining >= self.rate_limit_floor or not 0 < reset_in <= self.max_rate_limit_wait:
+            return # Orçamento folgado ou reset distante: segue sem esperar (o 403, se vier, é tratado acima)
+        self._log_message(f"Restam {remaining} requisições ao GitHub. Aguardando {reset_in:.0f}s pelo reset do limite.", "info")
+        time.sleep(reset_in + random.uniform(0, 1))
+
+    def _call_with_rate_limit_retry(self, service_name, func, *args, **kwargs):
+        """Chama `func` repetindo em erros de limite de taxa (429), com Retry-After ou backoff exponencial."""
+        for attempt in range(self.api_rate_limit_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.api_rate_limit_retries or not self._is_rate_limit_error(e):
+                    raise
+                wait = self._backoff_delay(attempt)
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    wait = min(float(retry_after), self.max_rate_limit_wait)
+                self._log_message(f"{service_name}: limite de taxa atingido. Nova tentativa em {wait:.1f}s ({attempt + 1}/{self.api_rate_limit_retries}).", "warning")
+                time.sleep(wait)
+
+    @staticmethod
+    def _is_rate_limit_error(error):
+        """429 do Gemini (ResourceExhausted), do gTTS ou de uma resposta HTTP."""
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        message = str(error)
+        return status == 429 or "429" in message or "ResourceExhausted" in type(error).__name__ or "rate limit" in message.lower()
+
+    def _backoff_delay(self, attempt):
+        """Espera exponencial com jitter, limitada por `github_backoff_cap`."""
+        return min(self.github_backoff_cap, self.github_backoff_base * 2 ** attempt + random.uniform(0, 1))
+
+    def _retry_wait(self, response, attempt):
+        """Segundos a esperar antes de repetir a requisição, ou None se não vale repetir."""
+        status = response.status_code
+        if status in (500, 502, 503, 504):
+            return self._backoff_delay(attempt)
+
+        retry_after = response.headers.get("Retry-After")
+        rate_limited = status == 429 or (status == 403 and (retry_after or response.headers.get("X-RateLimit-Remaining") == "0"))
+        if not rate_limited:
+            return None # Inclui 403 de token inválido/sem permissão: repetir não adianta
+
+        try:
+            if retry_after:
+                wait = float(retry_after)
+            elif response.headers.get("X-RateLimit-Reset"):
+                wait = int(response.headers["X-RateLimit-Reset"]) - time.time()
+            else:
+                wait = self._backoff_delay(attempt)
+        except ValueError:
+            wait = self._backoff_delay(attempt)
+        if wait > self.max_rate_limit_wait:
+            self._log_message(f"Limite de taxa do GitHub só reinicia em {wait / 60:.0f} min. Não vamos esperar.", "warning")
+            return None
+        return max(wait, 0) + random.uniform(0, 1)
+
     def parse_github_url(self, url):
         """Analisa a URL do GitHub para extrair proprietário, nome do repo e branch opcional."""
         try:
@@ -142,7 +626,12 @@ class GitHubPodcastGenerator:
             if len(path_parts) > 3 and path_parts[2] == "tree":
                 self.branch = path_parts[3]
             else:
-                self.branch = self._get_default_branch() # Tenta obter o default
+                # Branch padrão e README (da branch padrão) em paralelo: o README não depende
+                # do nome da branch, então sai do caminho crítico de fetch_repo_structure
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    readme_future = executor.submit(self._fetch_default_readme)
+                    self.branch = self._get_default_branch() # Tenta obter o default
+                    self._prefetched_readme = readme_future.result()
 
             self._log_message(f"Repositório: {self.repo_owner}/{self.repo_name} (Branch: {self.branch})", "info")
             return True
@@ -153,6 +642,20 @@ class GitHubPodcastGenerator:
             self._log_message(f"Erro inesperado ao analisar URL: {e}", "error")
             return False
 
+    def reset(self):
+        """Limpa o repositório atual e todo o estado por execução, mantendo clientes e sessão HTTP."""
+        self.repo_owner = None
+        self.repo_name = None
+        self.repo_url = None
+        self._reset_state()
+        self._reset_tts_settings()
+
+    def _reset_tts_settings(self):
+        """Volta provedor, chave e latência do TTS aos valores do construtor (ajustes de uma execução não vazam)."""
+        self.tts_provider = "gtts"
+        self.elevenlabs_api_key = self._elevenlabs_api_key_arg or os.getenv("ELEVENLABS_API_KEY")
+        self.tts_streaming_latency = 3 # 0 (qualidade máxima) a 4 (latência mínima)
+
     def _reset_state(self):
         """Reseta o estado interno para permitir análises de múltiplos repositórios."""
         self.branch = "main" # Reseta para default inicial
@@ -161,14 +664,27 @@ class GitHubPodcastGenerator:
         self.repo_summary = {}
         self.complexity_level = 'medium'
         self.total_code_chars_collected = 0
+        self.commit_sha = None
+        self.language_counts = Counter()
+        self.files_with_content_count = 0
+        self._prefetched_readme = None
+
+    def _fetch_default_readme(self):
+        """README da branch padrão pelo endpoint /readme, já em texto puro. None se não houver."""
+        api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/readme"
+        try:
+            response = self._github_get(api_url, headers={"Accept": "application/vnd.github.raw"}, persist_etag=True)
+            if not response.ok:
+                return None # 404: repositório sem README (fetch_repo_structure procura na árvore)
+            return self._limit_file_content(response.content.decode('utf-8', errors='replace'), "README")
+        except requests.RequestException:
+            return None
 
     def _get_default_branch(self):
         """Obtém a branch padrão do repositório via API do GitHub."""
         api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}"
         try:
-            response = requests.get(api_url, headers=self.headers)
-            # Espera um pouco antes de potencialmente dar erro
-            time.sleep(0.2)
+            response = self._github_get(api_url, persist_etag=True)
             response.raise_for_status()
             repo_info = response.json()
             default_branch = repo_info.get("default_branch", "main")
@@ -184,17 +700,48 @@ class GitHubPodcastGenerator:
                  self._log_message(f"Não foi possível obter a branch padrão (usando 'main'): {e}", "warning")
             return "main" # Retorna 'main' como fallback seguro
 
+    def _get_commit_sha(self):
+        """Resolve a branch atual para o SHA do commit HEAD (uma chamada leve à API)."""
+        api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/commits/{self.branch}"
+        try:
+            # Com este Accept a API responde só o SHA em texto puro, sem o JSON do commit
+            response = self._github_get(api_url, headers={"Accept": "application/vnd.github.sha"}, persist_etag=True)
+            response.raise_for_status()
+            commit_sha = response.text.strip()
+            self._log_message(f"Commit HEAD de '{self.branch}': {commit_sha[:7]}", "info")
+            return commit_sha or None
+        except requests.RequestException as e:
+            self._log_message(f"Não foi possível obter o commit HEAD (cache desativado para esta leitura): {e}", "warning")
+            return None
+
     def fetch_repo_structure(self, progress_callback=None):
         """Busca a estrutura do repositório e arquivos importantes, com limites aumentados."""
         self._log_message("Buscando estrutura do repositório (modo contexto amplo)...", "info")
         self.code_files = []
         self.readme_content = ""
         self.total_code_chars_collected = 0 # Reseta contador de caracteres
+        self.language_counts = Counter()
+        self.files_with_content_count = 0
+
+        # --- Cache por commit: mesmo repo sem novos commits não precisa de rede ---
+        self.commit_sha = self._get_commit_sha()
+        cache_key = (self.repo_owner, self.repo_name, self.commit_sha)
+        cached = self._get_cached_structure(cache_key) if self.commit_sha else None
+        if cached:
+            self.code_files = [dict(f) for f in cached["code_files"]]
+            self.readme_content = cached["readme_content"]
+            self.total_code_chars_collected = cached["total_code_chars_collected"]
+            self.language_counts = Counter(cached["language_counts"])
+            self.files_with_content_count = cached["files_with_content_count"]
+            self._log_message(f"Estrutura do commit {self.commit_sha[:7]} reaproveitada do cache ({len(self.code_files)} arquivos).", "success")
+            if progress_callback: progress_callback(0.5, "Estrutura obtida do cache.")
+            return True
 
-        api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/git/trees/{self.branch}?recursive=1"
+        tree_ref = self.commit_sha or self.branch
+        api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/git/trees/{tree_ref}?recursive=1"
 
         try:
-            response = requests.get(api_url, headers=self.headers)
+            response = self._github_get(api_url)
             response.raise_for_status()
             tree_data = response.json()
 
@@ -202,70 +749,125 @@ class GitHubPodcastGenerator:
                 self._log_message("A árvore do repositório é muito grande e foi truncada pela API do GitHub. Analisando arquivos disponíveis.", "warning")
 
             all_items = tree_data.get("tree", [])
-            total_items = len(all_items)
-            processed_items = 0
             files_content_read_count = 0 # Contador para o novo limite
 
             # Filtrar apenas blobs (arquivos) para a barra de progresso de leitura
             blob_items = [item for item in all_items if item["type"] == "blob"]
-            total_blobs = len(blob_items)
-            blobs_processed_for_content = 0
-
-            items_iterable = tqdm(blob_items, desc="Lendo conteúdo dos arquivos", unit="arquivo", disable=progress_callback is not None)
-
-            for item in items_iterable:
-                blobs_processed_for_content += 1
-                processed_items += 1 # Conta como item processado geral
-                if progress_callback:
-                    # Progresso baseado na leitura de blobs, mas mostrando o path
-                    progress_val = (blobs_processed_for_content / total_blobs) if total_blobs > 0 else 0
-                    progress_callback(progress_val * 0.5, f"Lendo: {item['path']}") # 0% a 50% para leitura
 
+            # --- 1ª passada (sem rede): classifica README e arquivos de código/texto relevantes ---
+            readme_items = []
+            # Montado a cada leitura (e não no __init__) para respeitar alterações em code_extensions
+            code_extensions = frozenset(ext.lower() for ext in self.code_extensions)
+            for item in blob_items:
                 file_path = item["path"]
-                file_name = os.path.basename(file_path)
-                _, ext = os.path.splitext(file_name)
-                ext_lower = ext.lower()
+                file_name = file_path.rpartition('/')[2]
+                # Mesma regra do os.path.splitext: pontos iniciais (ex: '.env') não são extensão
+                stem = file_name.lstrip('.')
+                dot = stem.rfind('.')
+                ext_lower = stem[dot:].lower() if dot != -1 else ''
 
                 # Processar README
                 if file_name.lower() == "readme.md":
-                    content = self._fetch_file_content_by_sha(item["sha"], file_path)
-                    if content:
-                        self.readme_content = content # Limite de chars aplicado na leitura
-                        self._log_message(f"README.md encontrado e processado ({len(content)} chars).", "info")
+                    readme_items.append(item)
 
                 # Processar arquivos de código/texto relevantes
-                elif ext_lower in self.code_extensions:
-                    file_info = {
+                elif ext_lower in code_extensions:
+                    # Mesmo se não ler o conteúdo, adiciona à lista para ter o path
+                    self.code_files.append({
                         "path": file_path,
                         "name": file_name,
                         "extension": ext_lower,
                         "sha": item["sha"],
+                        "size": item.get("size", 0),
                         "content": None # Inicializa sem conteúdo
-                    }
-                    # --- Lógica de leitura de conteúdo com limite maior ---
-                    if files_content_read_count < self.max_files_to_read_content:
-                        # Adiciona uma pausa menor para modelos rápidos como Flash
-                        time.sleep(0.05) # Reduzido para acelerar, ajustar se der rate limit
-                        content = self._fetch_file_content_by_sha(item["sha"], file_path)
-                        if content:
-                            file_info["content"] = content # Limite de chars por arquivo aplicado na leitura
-                            self.total_code_chars_collected += len(content) # Acumula caracteres LIDOS
-                            files_content_read_count += 1
-                            if files_content_read_count % 100 == 0: # Log a cada 100 arquivos lidos
-                                self._log_message(f"Lido conteúdo de {files_content_read_count} arquivos... ({self.total_code_chars_collected / 1000:.1f}k chars)", "info")
-
-                    # Mesmo se não ler o conteúdo, adiciona à lista para ter o path
-                    self.code_files.append(file_info)
+                    })
+                    # Contagem de linguagens na mesma passada da classificação
+                    language = self._language_from_extension(ext_lower)
+                    self.language_counts[language] += 1
                 # Ignorar outros tipos de arquivo para simplificar
 
+            # --- 2ª passada: leitura concorrente dos conteúdos ---
+            # As requisições são I/O puro e compartilham a sessão (keep-alive), então usamos
+            # um pool de threads em vez de um cliente assíncrono.
+            readable_files = [f for f in self.code_files if f["size"] <= self.max_file_bytes_to_read]
+            skipped_by_size = len(self.code_files) - len(readable_files)
+            if skipped_by_size:
+                self._log_message(f"{skipped_by_size} arquivo(s) acima de {self.max_file_bytes_to_read / 1000:.0f}kB não serão lidos.", "info")
+            source_files = [f for f in readable_files if not GENERATED_PATH_RE.search(f["path"])]
+            if len(source_files) < len(readable_files):
+                self._log_message(f"{len(readable_files) - len(source_files)} arquivo(s) vendorizados/gerados (node_modules, vendor, dist, build, .min) não serão lidos.", "info")
+            readable_files = source_files
+            files_to_read = readable_files[:self.max_files_to_read_content]
+            if self._prefetched_readme:
+                readme_items = [] # README já obtido junto com a branch padrão
+            # Um download por SHA: cópias idênticas (ex: __init__.py vazios, configs repetidas) reaproveitam o conteúdo
+            job_paths_by_sha = {}
+            for item in readme_items + files_to_read:
+                job_paths_by_sha.setdefault(item["sha"], item["path"])
+            fetch_jobs = list(job_paths_by_sha.items())
+            # Com token, a GraphQL traz dezenas de arquivos por requisição; sem token (ou se
+            # falhar), lê um a um do raw.githubusercontent.com.
+            cached_contents = {}
+            for sha, path in fetch_jobs:
+                content = self._read_cached_blob(sha)
+                if content is not None:
+                    cached_contents[path] = content
+            missing_jobs = [(sha, path) for sha, path in fetch_jobs if path not in cached_contents]
+            if cached_contents:
+                self._log_message(f"{len(cached_contents)} arquivo(s) lidos do cache em disco; {len(missing_jobs)} a baixar.", "info")
+
+            contents = self._fetch_contents_graphql([path for _, path in missing_jobs], tree_ref, progress_callback)
+            repo_bytes = sum(item.get("size", 0) for item in blob_items)
+            if contents is None and len(missing_jobs) >= self.tarball_min_files and repo_bytes <= self.max_tarball_bytes:
+                contents = self._fetch_contents_tarball([path for _, path in missing_jobs], tree_ref, progress_callback)
+            if contents is None:
+                contents = self._fetch_many_contents(missing_jobs, tree_ref, progress_callback)
+            for sha, path in missing_jobs:
+                if contents.get(path) is not None:
+                    self._write_cached_blob(sha, contents[path])
+            contents.update(cached_contents)
+            contents_by_sha = {sha: contents.get(path) for sha, path in fetch_jobs}
+
+            if self._prefetched_readme:
+                self.readme_content = self._prefetched_readme
+                self._log_message(f"README encontrado e processado ({len(self.readme_content)} chars).", "info")
+            for item in readme_items:
+                content = contents_by_sha.get(item["sha"])
+                if content:
+                    self.readme_content = content # Limite de chars aplicado na leitura
+                    self._log_message(f"README.md encontrado e processado ({len(content)} chars).", "info")
+
+            skipped_minified = 0
+            for file_info in files_to_read:
+                content = contents_by_sha.get(file_info["sha"])
+                if content and self._looks_minified(file_info["extension"], content):
+                    skipped_minified += 1
+                    continue # Fica só o path, sem conteúdo
+                if content:
+                    file_info["content"] = content # Limite de chars por arquivo aplicado na leitura
+                    self.total_code_chars_collected += len(content) # Acumula caracteres LIDOS
+                    files_content_read_count += 1
+            self.files_with_content_count = files_content_read_count
+            if skipped_minified:
+                self._log_message(f"{skipped_minified} arquivo(s) minificados ignorados.", "info")
+
             # --- Log do limite ---
-            if files_content_read_count >= self.max_files_to_read_content:
+            if len(readable_files) > self.max_files_to_read_content:
                  self._log_message(f"Limite de {self.max_files_to_read_content} arquivos com conteúdo lido atingido.", "warning")
             self._log_message(f"Encontrados {len(self.code_files)} arquivos relevantes. Conteúdo lido para {files_content_read_count} arquivos (Total: {self.total_code_chars_collected / 1000:.1f}k caracteres).", "info")
             # -------------------------------
 
             if not self.readme_content:
                 self._log_message("README.md não encontrado ou vazio.", "warning")
+
+            if self.commit_sha:
+                self._store_cached_structure(cache_key, {
+                    "code_files": [dict(f) for f in self.code_files],
+                    "readme_content": self.readme_content,
+                    "total_code_chars_collected": self.total_code_chars_collected,
+                    "language_counts": dict(self.language_counts),
+                    "files_with_content_count": self.files_with_content_count,
+                })
             return True
 
         except requests.RequestException as e:
@@ -280,38 +882,278 @@ class GitHubPodcastGenerator:
              self._log_message(f"Erro inesperado ao processar estrutura: {e}", "error")
              return False
 
+    def _fetch_many_contents(self, fetch_jobs, ref, progress_callback=None):
+        """Busca vários arquivos em paralelo. Recebe pares (sha, path) e retorna {path: conteúdo}."""
+        contents = {}
+        total_jobs = len(fetch_jobs)
+        if not total_jobs:
+            return contents
+
+        with self._worker_pool(self.max_github_workers) as executor:
+            future_to_path = {
+                executor.submit(self._fetch_raw_content, sha, path, ref): path
+                for sha, path in fetch_jobs
+            }
+            completed = as_completed(future_to_path)
+            completed = tqdm(completed, total=total_jobs, desc="Lendo conteúdo dos arquivos", unit="arquivo", disable=progress_callback is not None)
+            report_progress = self._throttle_progress(progress_callback)
+            for done_count, future in enumerate(completed, start=1):
+                path = future_to_path[future]
+                contents[path] = future.result() # _fetch_raw_content já trata seus erros
+                if report_progress:
+                    # Progresso baseado na leitura de conteúdos, mas mostrando o path
+                    report_progress((done_count / total_jobs) * 0.5, f"Lendo: {path}", final=done_count == total_jobs) # 0% a 50% para leitura
+                if done_count % 100 == 0: # Log a cada 100 arquivos lidos
+                    self._log_message(f"Lido conteúdo de {done_count}/{total_jobs} arquivos...", "info")
+        return contents
+
+    def _blob_cache_path(self, sha):
+        return self.blob_cache_dir / sha[:2] / f"{sha}.gz"
+
+    def _read_cached_blob(self, sha):
+        """Conteúdo do blob salvo em disco, ou None se não estiver no cache."""
+        cache_path = self._blob_cache_path(sha)
+        try:
+            content = gzip.decompress(cache_path.read_bytes()).decode("utf-8")
+            os.utime(cache_path) # Marca como usado recentemente (a limpeza remove pelo mtime)
+        except (OSError, EOFError, UnicodeDecodeError):
+            return None
+        return content[:self.max_chars_per_file_read]
+
+    def _write_cached_blob(self, sha, content):
+        """Salva o conteúdo (já limitado) do blob; falhas de disco só desativam o cache."""
+        cache_path = self._blob_cache_path(sha)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            # Código-fonte comprime ~4x: o mesmo limite de disco guarda muito mais blobs.
+            # Nível 1: compressão rápida, já que a gravação acontece no meio da leitura do repositório.
+            tmp_path.write_bytes(gzip.compress(content.encode("utf-8"), compresslevel=1))
+            os.replace(tmp_path, cache_path) # Escrita atômica: leitores nunca veem arquivo pela metade
+        except OSError as e:
+            self._log_message(f"Não foi possível gravar no cache de blobs ({e}).", "warning")
+            return
+        self._blob_cache_writes += 1
+        if self._blob_cache_writes % self.blob_cache_prune_every == 0:
+            self._prune_blob_cache()
+
+    def _prune_blob_cache(self):
+        """Remove os blobs menos usados até o cache caber em `max_blob_cache_bytes`."""
+        self._prune_cache_dir(self.blob_cache_dir, "*/*", self.max_blob_cache_bytes)
+
+    def _structure_cache_path(self, cache_key):
+        key_hash = hashlib.sha256("/".join(cache_key).encode("utf-8")).hexdigest()
+        return self.structure_cache_dir / f"{key_hash}.json"
+
+    def _get_cached_structure(self, cache_key):
+        """Estrutura do commit: primeiro da memória, depois do disco (que repõe a memória)."""
+        with self.clients.lock:
+            if cache_key in self._structure_cache:
+                self._structure_cache.move_to_end(cache_key)
+                return self._structure_cache[cache_key]
+        cache_path = self._structure_cache_path(cache_key)
+        try:
+            snapshot = json.loads(cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not self._is_valid_structure_snapshot(snapshot):
+            # Formato antigo ou arquivo editado: descarta e trata como cache miss
+            self._log_message(f"Cache de estrutura inválido descartado: {cache_path.name}", "warning")
+            try:
+                cache_path.unlink()
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        self._remember_structure(cache_key, snapshot)
+        return snapshot
+
+    @staticmethod
+    def _is_valid_structure_snapshot(snapshot):
+        """Confere chaves e tipos do snapshot lido do disco (o que fetch_repo_structure usa num hit)."""
+        if not isinstance(snapshot, dict):
+            return False
+        code_files = snapshot.get("code_files")
+        language_counts = snapshot.get("language_counts")
+        if not (isinstance(code_files, list)
+                and isinstance(snapshot.get("readme_content"), str)
+                and isinstance(snapshot.get("total_code_chars_collected"), int)
+                and isinstance(snapshot.get("files_with_content_count"), int)
+                and isinstance(language_counts, dict)
+                and all(isinstance(count, int) for count in language_counts.values())):
+            return False
+        for code_file in code_files:
+            if not (isinstance(code_file, dict)
+                    and all(isinstance(code_file.get(key), str) for key in ("path", "name", "extension", "sha"))
+                    and isinstance(code_file.get("size"), int)
+                    and "content" in code_file and isinstance(code_file["content"], (str, type(None)))):
+                return False
+        return True
+
+    def _store_cached_structure(self, cache_key, snapshot):
+        self._remember_structure(cache_key, snapshot)
+        cache_path = self._structure_cache_path(cache_key)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            tmp_path.write_text(AI_JSON_ENCODER.encode(snapshot), encoding="utf-8")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self._log_message(f"Não foi possível gravar a estrutura no cache em disco ({e}).", "warning")
+            return
+        self._prune_cache_dir(self.structure_cache_dir, "*.json", self.max_structure_cache_bytes)
+
+    def _remember_structure(self, cache_key, snapshot):
+        with self.clients.lock:
+            self._structure_cache[cache_key] = snapshot
+            while len(self._structure_cache) > self.max_cached_structures:
+                self._structure_cache.popitem(last=False) # Descarta o menos usado
+
+    @staticmethod
+    def _prune_cache_dir(cache_dir, pattern, max_bytes):
+        """Remove os arquivos menos usados (por mtime) até `cache_dir` caber em `max_bytes`."""
+        try:
+            entries = [(entry.stat(), entry) for entry in cache_dir.glob(pattern) if entry.is_file()]
+        except OSError:
+            return
+        total_bytes = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in sorted(entries, key=lambda pair: pair[0].st_mtime):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                entry.unlink()
+                total_bytes -= stat.st_size
+            except OSError:
+                pass
+
+    def _fetch_contents_tarball(self, paths, ref, progress_callback=None):
+        """
+        Lê os arquivos pedidos do tarball do commit (uma requisição, descompactado em streaming).
+        Retorna {path: conteúdo}, ou None se o download falhar.
+        """
+        api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/tarball/{ref}"
+        wanted = set(paths)
+        contents = dict.fromkeys(paths) # Ausentes do tarball (ex: submódulos) ficam como None
+        report_progress = self._throttle_progress(progress_callback)
+        read_count = 0
+        try:
+            with self._github_request("GET", api_url, stream=True) as response:
+                response.raise_for_status()
+                with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                    for member in archive:
+                        path = member.name.partition("/")[2] # Remove a pasta raiz '<owner>-<repo>-<sha>/'
+                        if not member.isfile() or path not in wanted:
+                            continue
+                        raw_bytes = archive.extractfile(member).read()
+                        contents[path] = self._limit_file_content(raw_bytes.decode('utf-8', errors='replace'), path)
+                        read_count += 1
+                        if report_progress:
+                            report_progress((read_count / len(wanted)) * 0.5, f"Lidos {read_count}/{len(wanted)} arquivos (tarball)", final=read_count == len(wanted))
+        except (requests.RequestException, tarfile.TarError, OSError) as e:
+            self._log_message(f"Leitura pelo tarball falhou ({e}). Lendo arquivo a arquivo.", "warning")
+            return None
+        self._log_message(f"{read_count} arquivo(s) lidos do tarball do repositório.", "info")
+        return contents
+
+    def _fetch_contents_graphql(self, paths, ref, progress_callback=None):
+        """
+        Lê vários arquivos pela API GraphQL, em lotes de `graphql_batch_size` por requisição.
+        Retorna {path: conteúdo}, ou None se não houver token ou a consulta falhar.
+        """
+        if not self.github_token or not paths:
+            return None
+
+        total_paths = len(paths)
+        batches = [paths[i:i + self.graphql_batch_size] for i in range(0, total_paths, self.graphql_batch_size)]
+        contents = {}
+        try:
+            with self._worker_pool(self.max_github_workers) as executor:
+                futures = [executor.submit(self._fetch_graphql_batch, batch, ref) for batch in batches]
+                for future in as_completed(futures):
+                    contents.update(future.result())
+                    if progress_callback:
+                        progress_callback((len(contents) / total_paths) * 0.5, f"Lidos {len(contents)}/{total_paths} arquivos (GraphQL)")
+        except (requests.RequestException, ValueError) as e:
+            self._log_message(f"Leitura via GraphQL falhou ({e}). Usando a API REST arquivo a arquivo.", "warning")
+            return None
+
+        self._log_message(f"Conteúdo de {total_paths} arquivos lido em {len(batches)} consulta(s) GraphQL.", "info")
+        return contents
+
+    def _fetch_graphql_batch(self, paths, ref):
+        """Uma consulta GraphQL com um alias `object(expression: "ref:path")` por arquivo."""
+        # Caminhos vão em variáveis, não interpolados na query, para não precisar escapar nada
+        variables = {"owner": self.repo_owner, "name": self.repo_name}
+        declarations = ["$owner: String!", "$name: String!"]
+        fields = []
+        for index, path in enumerate(paths):
+            variables[f"e{index}"] = f"{ref}:{path}"
+            declarations.append(f"$e{index}: String!")
+            fields.append(f"f{index}: object(expression: $e{index}) {{ ... on Blob {{ isBinary text }} }}")
+        query = f"query({', '.join(declarations)}) {{ repository(owner: $owner, name: $name) {{ {' '.join(fields)} }} }}"
+
+        response = self._github_request(
+            "POST",
+            GITHUB_GRAPHQL_URL,
+            json={"query": query, "variables": variables},
+            headers={"Authorization": f"bearer {self.github_token}"},
+            timeout=(self.request_timeout, self.request_timeout * 3), # Lotes grandes demoram mais para responder
+        )
+        response.raise_for_status()
+        payload = response.json()
+        repository = (payload.get("data") or {}).get("repository")
+        if repository is None:
+            raise ValueError(payload.get("errors") or "resposta sem 'repository'")
+
+        contents = {}
+        for index, path in enumerate(paths):
+            blob = repository.get(f"f{index}")
+            if not blob or blob.get("isBinary") or blob.get("text") is None:
+                contents[path] = None # Inexistente, binário ou grande demais para a API
+            else:
+                contents[path] = self._limit_file_content(blob["text"], path)
+        return contents
+
+    def _looks_minified(self, extension, content):
+        """Linha muito longa logo no início de um js/css/html/json/xml: bundle minificado ou gerado."""
+        if extension not in MINIFIABLE_EXTENSIONS:
+            return False
+        first_lines = content.split("\n", 20)[:20] # Sem quebrar o arquivo inteiro em linhas
+        return max(len(line) for line in first_lines) > self.max_minified_line_chars
+
+    def _limit_file_content(self, content, file_path):
+        """Aplica o limite de caracteres por arquivo."""
+        if len(content) > self.max_chars_per_file_read * 1.5:
+            # Log menos verboso para truncamento, só se for muito grande
+            self._log_message(f"Conteúdo do arquivo '{file_path}' truncado em {self.max_chars_per_file_read / 1000:.0f}k caracteres.", "warning")
+        return content[:self.max_chars_per_file_read]
+
+    def _fetch_raw_content(self, sha, file_path, ref):
+        """
+        Lê o arquivo direto do raw.githubusercontent.com: UTF-8 puro, sem JSON nem base64,
+        e fora da cota da API REST. Se falhar (ex: repo privado sem token), usa o blob por SHA.
+        """
+        raw_url = f"https://raw.githubusercontent.com/{self.repo_owner}/{self.repo_name}/{ref}/{quote(file_path)}"
+        try:
+            response = self._github_get(raw_url)
+            if response.ok:
+                return self._limit_file_content(response.content.decode('utf-8', errors='replace'), file_path)
+        except requests.RequestException:
+            pass
+        return self._fetch_file_content_by_sha(sha, file_path)
+
     def _fetch_file_content_by_sha(self, sha, file_path):
-        """Busca e decodifica o conteúdo do arquivo usando o SHA, com limite aumentado."""
+        """Busca o conteúdo do arquivo pelo SHA do blob, em bytes puros (sem JSON nem base64)."""
         api_url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/git/blobs/{sha}"
         try:
-            response = requests.get(api_url, headers=self.headers)
+            response = self._github_get(api_url, headers={"Accept": "application/vnd.github.raw"})
             response.raise_for_status()
-            content_data = response.json()
-
-            if content_data.get("encoding") == "base64" and content_data.get("content"):
-                # Tratamento de erro na decodificação
-                try:
-                    decoded_content = base64.b64decode(content_data["content"]).decode('utf-8', errors='replace')
-                except Exception as decode_err:
-                    self._log_message(f"Erro ao decodificar {file_path}: {decode_err}. Pulando arquivo.", "warning")
-                    return None # Falha na decodificação
-
-                # --- Limite de caracteres por arquivo aumentado ---
-                limited_content = decoded_content[:self.max_chars_per_file_read]
-                if len(decoded_content) > self.max_chars_per_file_read:
-                     # Log menos verboso para truncamento, só se for muito grande
-                     if len(decoded_content) > self.max_chars_per_file_read * 1.5:
-                         self._log_message(f"Conteúdo do arquivo '{file_path}' truncado em {self.max_chars_per_file_read / 1000:.0f}k caracteres.", "warning")
-                return limited_content
-                # --------------------------------------------------------
-            elif content_data.get("encoding") != "base64":
-                 # Arquivos não-base64 (ex: binários grandes detectados como texto) podem não ter 'content' ou ter encoding diferente
-                 self._log_message(f"Arquivo '{file_path}' não está em base64 (encoding: {content_data.get('encoding', 'N/A')}). Pulando conteúdo.", "warning")
-                 return None
-            else:
-                 # Pode ser um arquivo vazio
-                 # self._log_message(f"Arquivo '{file_path}' tem resposta base64 mas sem conteúdo.", "info")
-                 return "" # Retorna vazio se não tiver conteúdo
+            # Decodifica só o necessário para o limite de caracteres (até 4 bytes UTF-8 por caractere)
+            raw_prefix = response.content[:self.max_chars_per_file_read * 4]
+            return self._limit_file_content(raw_prefix.decode('utf-8', errors='replace'), file_path)
 
         except requests.RequestException as e:
             status_code = e.response.status_code if hasattr(e, 'response') and e.response is not None else 'N/A'
@@ -321,9 +1163,6 @@ class GitHubPodcastGenerator:
             else:
                  self._log_message(f"Erro {status_code} ao buscar conteúdo do arquivo '{file_path}': {e}", "warning")
             return None
-        except json.JSONDecodeError as e:
-            self._log_message(f"Erro ao decodificar JSON da resposta para '{file_path}': {e}", "warning")
-            return None
         except Exception as e:
             self._log_message(f"Erro inesperado ao buscar conteúdo do arquivo '{file_path}': {e}", "warning")
             return None
@@ -353,67 +1192,103 @@ class GitHubPodcastGenerator:
 
         if self.readme_content:
             # Tenta extrair título do H1
-            match_title = re.search(r'^#\s+(.*?)\n', self.readme_content, re.MULTILINE)
+            match_title = README_TITLE_RE.search(self.readme_content)
             if match_title:
                 self.repo_summary["title"] = match_title.group(1).strip()
 
-            # Limpa badges comuns no início
-            content_after_title = re.sub(r'^#\s+.*?\n', '', self.readme_content, count=1)
-            content_cleaned = re.sub(r'^\[!\[.*?\]\(.*?\)\]\(.*?\)\s*?\n?', '', content_after_title, flags=re.MULTILINE)
-            content_cleaned = re.sub(r'^\<p align="center"\>.*?\</p\>\s*', '', content_cleaned, flags=re.IGNORECASE | re.DOTALL) # Limpa blocos <p align="center">
+            # Limpa badges comuns no início (só no trecho inicial: sem copiar o README inteiro a cada sub)
+            readme_head = self.readme_content[:README_SUMMARY_WINDOW]
+            content_after_title = README_LEADING_TITLE_RE.sub('', readme_head, count=1)
+            content_cleaned = README_BADGE_RE.sub('', content_after_title)
+            content_cleaned = README_CENTERED_BLOCK_RE.sub('', content_cleaned) # Limpa blocos <p align="center">
 
             # Tenta pegar a primeira descrição significativa
-            match_desc = re.search(r'^\s*(.+?)\n(\n|\s*#|$)', content_cleaned, re.DOTALL | re.MULTILINE)
+            match_desc = README_DESCRIPTION_RE.search(content_cleaned)
 
             if match_desc:
                 desc = match_desc.group(1).strip()
-                # Limpa múltiplos espaços/newlines dentro da descrição
-                desc_cleaned = ' '.join(desc.split())
-                self.repo_summary["description"] = textwrap.shorten(desc_cleaned, width=500, placeholder="...")
+                self.repo_summary["description"] = self._shorten_words(desc)
             else:
                  # Fallback: pega as primeiras linhas não vazias
                  lines = [line for line in content_cleaned.strip().splitlines() if line.strip()][:5]
                  fallback_desc = ' '.join(lines)
-                 self.repo_summary["description"] = textwrap.shorten(fallback_desc, width=500, placeholder="...")
+                 self.repo_summary["description"] = self._shorten_words(fallback_desc)
         else:
             self.repo_summary["description"] = f"Um repositório GitHub de {self.repo_owner} sem README.md detalhado."
 
         self._log_message(f"Título: {self.repo_summary['title']}", "info")
         self._log_message(f"Descrição: {self.repo_summary['description']}", "info")
 
-    def _analyze_code_structure(self):
-        """Analisa os arquivos de código e sua estrutura."""
-        self.repo_summary["languages"] = {}
-        self.repo_summary["file_count"] = len(self.code_files)
-        total_code_files_with_content = sum(1 for f in self.code_files if f.get("content") is not None) # Checa se content existe (mesmo que vazio)
+    @staticmethod
+    def _shorten_words(text, width=500, placeholder="..."):
+        """Mesmo resultado de textwrap.shorten, mas só percorre o começo do texto.
 
-        for file in self.code_files:
-            if file["extension"]:
-                # Trata extensões como '.dockerfile' ou '.yml'
-                ext = file["extension"][1:] if file["extension"] != '.dockerfile' else 'dockerfile'
-                ext = 'yaml' if ext == 'yml' else ext
-                self.repo_summary["languages"][ext] = self.repo_summary["languages"].get(ext, 0) + 1
+        As palavras são lidas até passar de `width` caracteres (o resto nunca
+        aparece no resultado) e o textwrap.shorten roda só sobre esse prefixo.
+        """
+        words = []
+        total = 0
+        for match in re.finditer(r'\S+', text):
+            words.append(match.group())
+            total += len(words[-1])
+            if total > width:
+                break
+        return textwrap.shorten(' '.join(words), width, placeholder=placeholder)
+
+    @staticmethod
+    def _language_from_extension(ext_lower):
+        """Normaliza a extensão (ex: '.yml' -> 'yaml') para a contagem de linguagens."""
+        # Trata extensões como '.dockerfile' ou '.yml'
+        ext = ext_lower[1:] if ext_lower != '.dockerfile' else 'dockerfile'
+        return 'yaml' if ext == 'yml' else ext
 
+    def _analyze_code_structure(self):
+        """Analisa os arquivos de código e sua estrutura (contagens já acumuladas em fetch_repo_structure)."""
         # Ordena por contagem descendente
-        self.repo_summary["languages"] = dict(sorted(self.repo_summary["languages"].items(), key=lambda item: item[1], reverse=True))
+        self.repo_summary["languages"] = dict(self.language_counts.most_common())
+        self.repo_summary["file_count"] = len(self.code_files)
         self._log_message(f"Linguagens detectadas: {self.repo_summary['languages']}", "info")
-        self._log_message(f"{total_code_files_with_content} arquivos tiveram conteúdo carregado para análise (total de {self.total_code_chars_collected / 1000:.1f}k caracteres).", "info")
+        self._log_message(f"{self.files_with_content_count} arquivos tiveram conteúdo carregado para análise (total de {self.total_code_chars_collected / 1000:.1f}k caracteres).", "info")
+
+    @staticmethod
+    def _match_key_file_type(fn_lower, path_lower):
+        """
+        Tipo de arquivo chave (ver KEY_FILE_PATTERNS) para um nome/path, ou None.
+        Equivale a testar todos os termos em ordem e ficar com o primeiro válido, mas os
+        prefixos do nome são buscados no índice em vez de um startswith por termo.
+        """
+        path_parts = path_lower.split('/')
+        best = None # (ordem, tipo) do primeiro termo válido
+
+        # Nome começa com o termo (cobre também nome igual ao termo e 'config.js' para 'config')
+        for length in KEY_FILE_PREFIX_LENGTHS:
+            if length > len(fn_lower):
+                break
+            hit = KEY_FILE_PREFIX_INDEX.get(fn_lower[:length])
+            if not hit or (best and hit[0] >= best[0]):
+                continue
+            # Exceção: evitar 'test' em nomes como 'latest.txt'
+            if hit[1] == 'test' and not ('test' in path_parts or 'spec' in path_parts):
+                continue
+            best = hit
+
+        # Termo contido no path (útil para workflows, tests, routing)
+        for order, type, term in KEY_FILE_PATH_TERMS:
+            if best and order >= best[0]:
+                break
+            if term not in path_lower or fn_lower.startswith(term):
+                continue # Termo que casou como prefixo já foi decidido acima
+            # Refinamento para testes (deve estar numa pasta chamada test/tests/spec)
+            if type == 'test' and not any(p in path_parts for p in ['test', 'tests', 'spec']):
+                continue
+            best = (order, type)
+            break
+
+        return best[1] if best else None
 
     def _identify_key_components(self):
         """Identifica componentes chave e arquivos importantes (heurística simples)."""
         key_files = []
-        # Patterns melhorados e expandidos
-        patterns = {
-            'config': ['config', 'settings', 'conf', 'manifest', 'values.yaml', 'chart.yaml', '.env', 'env.', 'properties', 'application.yml', 'bootstrap.yml', 'appsettings.json'],
-            'entry': ['main', 'app', 'index', 'server', 'run', '__main__', 'wsgi', 'asgi', 'program.cs', 'startup.cs'],
-            'build': ['package.json', 'requirements.txt', 'pom.xml', 'build.gradle', 'dockerfile', 'makefile', 'setup.py', 'go.mod', 'cargo.toml', 'composer.json', '.csproj', '.sln', 'rakefile'],
-            'docs': ['contributing.md', 'license', 'code_of_conduct.md', 'changelog.md', 'readme.md'], # Adicionado readme aqui também
-            'test': ['test_', '_test', '.spec.', '.test.'], # Mantido simples
-            'workflow': ['.github/workflows', '.gitlab-ci.yml', 'azure-pipelines.yml', 'jenkinsfile'],
-            'ui_framework_config': ['vite.config.', 'webpack.config.', 'next.config.', 'nuxt.config.', 'tailwind.config.', 'postcss.config.'],
-            'orm_migration': ['migration', 'alembic', 'prisma/schema.prisma'],
-            'routing': ['routes.', 'urls.py', 'controller', 'handler'],
-        }
         # Arquivos/pastas comuns a serem verificados por existência
         common_checks = {
             'entry/framework': ['manage.py', 'artisan'],
@@ -431,30 +1306,12 @@ class GitHubPodcastGenerator:
 
         # 1. Checar por padrões de nome/extensão
         for file in self.code_files:
-            fn_lower = file["name"].lower()
-            path_lower = file["path"].lower()
-            matched_type = None
-
-            for type, terms in patterns.items():
-                for term in terms:
-                    # Verifica se o nome do arquivo começa com o termo, é igual ao termo, ou se a extensão casa (ex: config.js)
-                    if fn_lower.startswith(term) or fn_lower == term or os.path.splitext(fn_lower)[0] == term:
-                        # Exceção: evitar 'test' em nomes como 'latest.txt'
-                        if type == 'test' and not ('test' in path_lower.split('/') or 'spec' in path_lower.split('/')):
-                             continue
-                        matched_type = type
-                        break
-                    # Verifica se o termo está contido no path (útil para workflows, tests, routing)
-                    if term in path_lower and type in ['workflow', 'test', 'routing', 'orm_migration']:
-                         # Refinamento para testes (deve estar numa pasta chamada test/tests/spec)
-                         if type == 'test' and not any(p in path_lower.split('/') for p in ['test', 'tests', 'spec']):
-                             continue
-                         matched_type = type
-                         break
-                if matched_type: break
-
+            matched_type = self._match_key_file_type(file["name"].lower(), file["path"].lower())
             if matched_type:
                  key_files.append({"path": file["path"], "type": matched_type})
+        key_file_paths = {kf["path"] for kf in key_files}
+        # Pastas de primeiro nível ('docs/', 'src/', ...), para checar existência sem varrer os arquivos
+        top_level_dirs = {fp.split('/', 1)[0] + '/' for fp in file_paths_lower if '/' in fp}
 
         # 2. Checar por existência de arquivos/pastas comuns
         checked_common_paths = set()
@@ -464,20 +1321,19 @@ class GitHubPodcastGenerator:
                  found_path = None
                  if path_pattern.endswith('/'): # É uma pasta
                      prefix = path_pattern
-                     for fp_lower, fp_orig in file_paths_lower.items():
-                         if fp_lower.startswith(prefix) and prefix not in checked_common_paths:
-                            found_path = prefix # Marca a pasta como encontrada
-                            checked_common_paths.add(prefix)
-                            break
+                     if prefix in top_level_dirs and prefix not in checked_common_paths:
+                        found_path = prefix # Marca a pasta como encontrada
+                        checked_common_paths.add(prefix)
                  else: # É um arquivo
                      if path_pattern in file_paths_lower and path_pattern not in checked_common_paths:
                          found_path = file_paths_lower[path_pattern] # Pega o path original
                          checked_common_paths.add(path_pattern)
 
 
-                 if found_path and not any(kf['path'] == found_path for kf in key_files):
+                 if found_path and found_path not in key_file_paths:
                      # Adiciona se encontrou e ainda não está na lista
                      key_files.append({"path": found_path, "type": type})
+                     key_file_paths.add(found_path)
 
 
         # Limita a lista enviada no sumário (mas a IA terá acesso a mais arquivos no contexto)
@@ -535,16 +1391,19 @@ class GitHubPodcastGenerator:
         self._log_message(f"Complexidade do repositório avaliada como: {self.complexity_level.upper()} (Score: {score:.2f})", "info")
         self._log_message(f"Critérios: Arquivos={num_files}, Chars Código={code_chars/1000:.1f}k, Linguagens={num_langs}, README={readme_len} chars", "info")
 
-    def generate_podcast_script(self, progress_callback=None):
+    def generate_podcast_script(self, progress_callback=None, stream_callback=None):
         """
         Gera o script do podcast usando o modelo Gemini.
         **Adapta o prompt para pedir um script conciso ou detalhado com base na complexidade.**
+        Lança PodcastGenerationError em caso de falha; em sucesso retorna apenas o roteiro.
+        Se `stream_callback` for fornecido, a resposta é recebida em streaming e cada trecho
+        de texto é repassado a ele assim que chega (o script completo continua sendo retornado).
         """
         # Assegura que a análise (e avaliação de complexidade) foi feita
         if not self.repo_summary:
              if not self.analyze_repository(progress_callback):
                  self._log_message("Falha na análise inicial, não é possível gerar script.", "error")
-                 return self._generate_stub_podcast_script("Falha ao analisar o repositório.")
+                 raise self._generation_error("Falha ao analisar o repositório.")
 
         # Determina qual prompt usar com base na complexidade
         if self.complexity_level == 'complex':
@@ -557,17 +1416,19 @@ class GitHubPodcastGenerator:
             log_prefix = "CONCISO"
             progress_stage = 0.75
             progress_msg = f"Gerando roteiro CONCISO com {self.gemini_model_name}..."
+        # A indentação do código-fonte não precisa virar tokens no prompt
+        prompt_text = textwrap.dedent(prompt_text).strip()
 
         self._log_message(f"Gerando script {log_prefix} do podcast com {self.gemini_model_name}...", "info")
 
         if not self.gemini_api_key:
             self._log_message("API Key da Gemini não configurada. Gerando script de exemplo.", "error")
-            return self._generate_stub_podcast_script()
+            raise self._generation_error("API Key da Gemini não configurada.")
 
         # --- Preparação de dados para IA (mesma lógica de antes, mas com limites maiores) ---
         if progress_callback: progress_callback(progress_stage * 0.8, "Preparando dados para IA...") # Ajuste no progresso
 
-        key_file_paths = [kf['path'] for kf in self.repo_summary.get('key_files_guess', [])]
+        key_file_paths = {kf['path'] for kf in self.repo_summary.get('key_files_guess', [])} # set: teste O(1) na chave de ordenação
         # Prioriza arquivos chave E arquivos com mais conteúdo (indicativo de importância)
         files_with_content = sorted(
             [f for f in self.code_files if f.get('content') is not None],
@@ -576,22 +1437,32 @@ class GitHubPodcastGenerator:
 
         code_snippets_for_ai = []
         total_code_chars_to_send = 0
+        first_path_by_sha = {} # Arquivos idênticos (mesmo SHA) vão uma vez só; as cópias só apontam para o original
+        skipped_for_budget = 0
 
         self._log_message(f"Tentando incluir até ~{self.max_total_code_chars_for_ai / 1000:.0f}k caracteres de código no prompt para a IA.", "info")
 
         for file in files_with_content:
-            content_to_add = file.get('content', '') # Pega conteúdo (pode ser vazio)
+            if file.get("sha") in first_path_by_sha:
+                code_snippets_for_ai.append({"path": file["path"], "same_as": first_path_by_sha[file["sha"]]})
+                continue # Não consome o limite de caracteres
+            content_to_add = self._compact_source(file.get('content', '')) # Pega conteúdo (pode ser vazio)
+            content_chars = len(content_to_add)
             # Verifica limite total E limite por arquivo (redundante, mas seguro)
-            if total_code_chars_to_send + len(content_to_add) <= self.max_total_code_chars_for_ai and len(content_to_add) <= self.max_chars_per_file_read:
+            if total_code_chars_to_send + content_chars <= self.max_total_code_chars_for_ai and content_chars <= self.max_chars_per_file_read:
                 code_snippets_for_ai.append({
                     "path": file["path"],
                     "content": content_to_add
                 })
-                total_code_chars_to_send += len(content_to_add)
+                total_code_chars_to_send += content_chars
+                if file.get("sha"):
+                    first_path_by_sha[file["sha"]] = file["path"]
             else:
-                # Para o loop se atingir o limite total
-                self._log_message(f"Limite total de {self.max_total_code_chars_for_ai / 1000:.0f}k caracteres de código para IA atingido ou arquivo individual muito grande. {len(code_snippets_for_ai)}/{len(files_with_content)} arquivos com conteúdo incluídos no prompt.", "warning")
-                break
+                # Não cabe no que resta do limite: segue procurando arquivos menores que ainda caibam
+                skipped_for_budget += 1
+
+        if skipped_for_budget:
+            self._log_message(f"Limite total de {self.max_total_code_chars_for_ai / 1000:.0f}k caracteres de código para IA atingido ou arquivo individual muito grande. {len(code_snippets_for_ai)}/{len(files_with_content)} arquivos com conteúdo incluídos no prompt.", "warning")
 
         self._log_message(f"Total de caracteres de código efetivamente incluídos para a IA: {total_code_chars_to_send / 1000:.1f}k", "info")
 
@@ -621,27 +1492,48 @@ class GitHubPodcastGenerator:
             # --- Mesma lógica de chamada da API ---
             # ATENÇÃO: Modelos como 1.5 Pro podem lidar com contextos MUITO maiores.
             # Certifique-se de que sua cota e limites da API comportam o volume de dados.
-            model = genai.GenerativeModel(self.gemini_model_name)
             prompt_chars = len(prompt_text)
-            # Estima o tamanho dos dados em JSON. Pode ser grande.
+            # Serializa os dados uma única vez (tamanho, chave de cache e envio). Pode ser grande.
+            script_cache_key = None
+            data_str = None
             try:
-                 data_str = json.dumps(repo_data_for_ai)
+                 data_str = self._serialize_for_ai(repo_data_for_ai)
                  data_chars = len(data_str)
+                 script_cache_key = self._script_cache_key(prompt_text, data_str)
             except Exception as json_e:
                  self._log_message(f"Erro ao serializar dados para IA: {json_e}. Usando estimativa.", "warning")
                  data_chars = total_code_chars_to_send + len(readme_for_ai) + len(str(self.repo_summary)) + 10000 # Estimativa grosseira
 
+            # --- Mesmo prompt + mesmos dados: reaproveita o roteiro já gerado ---
+            cached_script = self._read_cached_script(script_cache_key)
+            if cached_script is not None:
+                self._log_message(f"Roteiro {log_prefix} reaproveitado do cache (mesmo modelo, prompt e dados).", "success")
+                if stream_callback: stream_callback(cached_script)
+                if progress_callback: progress_callback(0.9, f"Roteiro {log_prefix.lower()} obtido do cache!")
+                return cached_script
+
             total_input_chars_est = prompt_chars + data_chars
             self._log_message(f"Enviando prompt ({log_prefix}) + dados (~{total_input_chars_est / 1000:.0f}k caracteres estimados) para {self.gemini_model_name}...", "info")
 
-            # Envia o prompt escolhido e os dados
-            response = model.generate_content(
-                 [prompt_text, json.dumps(repo_data_for_ai)], # Envia como partes separadas
+            # Envia os dados e o prompt escolhido (dados primeiro: prefixo estável, que a API
+            # consegue reaproveitar em cache; as instruções fecham a mensagem)
+            model, contents = self._model_and_contents(prompt_text, data_str or self._serialize_for_ai(repo_data_for_ai))
+            response = self._call_with_rate_limit_retry(
+                 f"Gemini ({self.gemini_model_name})",
+                 model.generate_content,
+                 contents,
                  generation_config=self.generation_config,
-                 safety_settings=self.safety_settings
+                 safety_settings=self.safety_settings,
+                 stream=stream_callback is not None
             )
             # --------------------------------------
 
+            # --- Streaming: repassa cada trecho à interface; ao final, a resposta fica completa ---
+            if stream_callback:
+                for chunk in response:
+                    if chunk.candidates and chunk.candidates[0].content.parts:
+                        stream_callback(chunk.text)
+
             # --- Mesma lógica de tratamento de resposta e erro ---
             if not response.candidates:
                  # Tenta obter mais detalhes sobre o bloqueio
@@ -657,54 +1549,202 @@ class GitHubPodcastGenerator:
 
                  self._log_message(f"Geração bloqueada pela API Gemini ({self.gemini_model_name}). Razão: {block_reason}", "error")
                  self._log_message(f"Classificações de segurança do prompt: {safety_ratings_str}", "warning")
-                 return self._generate_stub_podcast_script(f"Erro: Conteúdo bloqueado pela política de segurança da IA ({self.gemini_model_name}). Razão: {block_reason}")
-
-            # Extrai o texto da primeira (e única) candidata
-            script = response.text
-
-            # Adiciona rodapé padrão
-            script += f"""
-            \n\n---\n
-            [VINHETA DE ENCERRAMENTO]\n
-            Roteiro {log_prefix} gerado por Explica Código (usando {self.gemini_model_name}).
-            Repositório analisado: {self.repo_url}
-            Complexidade estimada: {self.complexity_level.upper()}
-            """
+                 raise self._generation_error(f"Erro: Conteúdo bloqueado pela política de segurança da IA ({self.gemini_model_name}). Razão: {block_reason}")
+
+            # Texto da primeira (e única) candidata + rodapé padrão, montados numa única junção
+            script = "\n".join([
+                response.text.strip(),
+                "",
+                "---",
+                "",
+                "[VINHETA DE ENCERRAMENTO]",
+                "",
+                f"Roteiro {log_prefix} gerado por Explica Código (usando {self.gemini_model_name}).",
+                f"Repositório analisado: {self.repo_url}",
+                f"Complexidade estimada: {self.complexity_level.upper()}",
+            ])
 
             self._log_message(f"Script {log_prefix} do podcast gerado com sucesso!", "success")
             if progress_callback: progress_callback(0.9, f"Roteiro {log_prefix.lower()} gerado!")
-            return script.strip()
+            self._write_cached_script(script_cache_key, script)
+            return script
 
         # --- Tratamento de Erros da API Gemini ---
+        except PodcastGenerationError:
+             raise # Já tratado acima (ex: resposta sem candidatas)
         except genai.types.BlockedPromptException as e:
              self._log_message(f"Geração bloqueada (BlockedPromptException) pela API Gemini ({self.gemini_model_name}).", "error")
              # Tentar extrair detalhes, embora possa não haver na exceção diretamente
-             return self._generate_stub_podcast_script(f"Erro: Conteúdo bloqueado pela política de segurança da IA ({self.gemini_model_name}).")
+             raise self._generation_error(f"Erro: Conteúdo bloqueado pela política de segurança da IA ({self.gemini_model_name}).")
         except genai.types.StopCandidateException as e:
              self._log_message(f"Geração interrompida (StopCandidateException) pela API Gemini ({self.gemini_model_name}). Pode ser devido a políticas de segurança na *resposta*.", "error")
              # A resposta parcial pode estar em e.candidate, mas é arriscado usar
-             return self._generate_stub_podcast_script(f"Erro: Geração interrompida pela IA ({self.gemini_model_name}), possivelmente por segurança no conteúdo gerado.")
+             raise self._generation_error(f"Erro: Geração interrompida pela IA ({self.gemini_model_name}), possivelmente por segurança no conteúdo gerado.")
         except requests.exceptions.RequestException as e: # Erros de rede/HTTP
              self._log_message(f"Erro de rede/HTTP ao comunicar com a API Gemini: {e}", "error")
-             return self._generate_stub_podcast_script(f"Erro de comunicação com a API: {e}")
+             raise self._generation_error(f"Erro de comunicação com a API: {e}")
         except Exception as e: # Outros erros genéricos
              self._log_message(f"Erro inesperado ao gerar script com {self.gemini_model_name}: {e}", "error")
-             # Tratamento específico para erros comuns
-             if "429" in str(e) or "ResourceExhaustedError" in str(e) or "rate limit" in str(e).lower():
+             # Tratamento específico para erros comuns (mensagem convertida uma vez só)
+             error_text = str(e).lower()
+             if self._is_rate_limit_error(e): # Também reconhece ResourceExhausted pelo tipo
                  self._log_message("Erro 429: Limite de taxa da API Gemini atingido (RPM/TPM). Tente novamente mais tarde ou verifique sua cota.", "error")
                  error_detail = "Limite de taxa da API Gemini atingido."
-             elif "API key not valid" in str(e) or "permission denied" in str(e).lower():
+             elif "api key not valid" in error_text or "permission denied" in error_text:
                   self._log_message("Erro: API Key da Gemini inválida ou sem permissão.", "error")
                   error_detail = "API Key inválida ou sem permissão."
-             elif "invalid json" in str(e).lower():
+             elif "invalid json" in error_text:
                   self._log_message("Erro: Problema ao formatar os dados enviados para a IA (JSON inválido). Verifique a estrutura dos dados.", "error")
                   error_detail = "Erro interno na formatação dos dados."
              else:
                   error_detail = f"Erro inesperado na IA: {e}"
 
-             import traceback
              self._log_message(traceback.format_exc(), "error") # Log completo do traceback para debug
-             return self._generate_stub_podcast_script(f"Erro na comunicação com o modelo {self.gemini_model_name}: {error_detail}")
+             raise self._generation_error(f"Erro na comunicação com o modelo {self.gemini_model_name}: {error_detail}")
+
+    @staticmethod
+    def _compact_source(content):
+        """
+        Remove só espaços que não mudam o sentido (fim de linha e blocos de linhas em branco).
+        Comentários e docstrings ficam: explicam o código, que é o assunto do podcast.
+        """
+        content = TRAILING_WHITESPACE_RE.sub('', content)
+        return BLANK_LINES_RE.sub('\n\n', content)
+
+    @staticmethod
+    def _serialize_for_ai(repo_data_for_ai):
+        """
+        Texto enviado à IA: metadados em JSON compacto e README/código como texto puro, um bloco
+        por arquivo. Sem as aspas e quebras de linha escapadas do JSON, o código rende menos tokens.
+        """
+        metadata = {k: v for k, v in repo_data_for_ai.items() if k not in ("readme_content", "code_files_analyzed")}
+        if orjson is not None:
+            metadata_json = orjson.dumps(metadata).decode("utf-8") # Mesmo formato, gerado em C
+        else:
+            metadata_json = AI_JSON_ENCODER.encode(metadata)
+
+        sections = [
+            "## Dados do repositório (JSON)", metadata_json, "",
+            "## README", repo_data_for_ai["readme_content"], "",
+            "## Arquivos de código analisados",
+        ]
+        for snippet in repo_data_for_ai["code_files_analyzed"]:
+            if "same_as" in snippet:
+                sections.append(f"### Arquivo: {snippet['path']} (conteúdo idêntico a {snippet['same_as']})")
+                continue
+            content = snippet["content"]
+            fence = "````" if "```" in content else "```" # Não fecha o bloco antes da hora
+            language = os.path.splitext(snippet["path"])[1][1:]
+            sections.append(f"### Arquivo: {snippet['path']}\n{fence}{language}\n{content}\n{fence}")
+        return "\n".join(sections)
+
+    def _model_and_contents(self, prompt_text, data_str):
+        """
+        Modelo e partes da mensagem para a chamada à Gemini. Com cache de contexto os dados
+        ficam no cache e só o prompt é enviado; sem ele, payloads grandes vão como arquivo da
+        Files API e os demais seguem como dados + prompt na mensagem.
+        """
+        if self.use_context_cache and len(data_str) // 4 >= self.min_context_cache_tokens: # ~4 caracteres por token
+            context_cache = self._get_context_cache(data_str)
+            if context_cache is not None:
+                return genai.GenerativeModel.from_cached_content(cached_content=context_cache), [prompt_text]
+        model = self.clients.gemini_model(self.gemini_model_name)
+        if self.use_files_api and len(data_str) >= self.min_files_api_chars:
+            uploaded = self._get_uploaded_payload(data_str)
+            if uploaded is not None:
+                return model, [uploaded, prompt_text]
+        return model, [data_str, prompt_text]
+
+    def _get_uploaded_payload(self, data_str):
+        """Envia os dados do repositório pela Files API (uma vez por conteúdo) e devolve o handle."""
+        now = time.time()
+        payload = data_str.encode("utf-8") # Codificado uma vez: serve ao hash e ao envio
+        payload_key = hashlib.sha256(payload).hexdigest()
+        uploaded = self._get_unexpired(self._uploaded_payloads, payload_key, now)
+        if uploaded is not None:
+            return uploaded
+
+        try:
+            uploaded = genai.upload_file(
+                io.BytesIO(payload),
+                mime_type="text/plain",
+                display_name=f"podcastgit-{self.repo_owner}-{self.repo_name}",
+            )
+        except Exception as e:
+            self._log_message(f"Envio pela Files API da Gemini falhou ({e}). Enviando os dados na mensagem.", "warning")
+            return None
+
+        self._log_message(f"Dados do repositório enviados pela Files API ({len(data_str) / 1000:.0f}k caracteres).", "info")
+        with self.clients.lock:
+            self._uploaded_payloads[payload_key] = (uploaded, now + self.files_api_ttl_seconds)
+        return uploaded
+
+    def _get_context_cache(self, data_str):
+        """Cria (ou reaproveita, enquanto não expira) um CachedContent com os dados do repositório."""
+        now = time.time()
+        cache_key = hashlib.sha256(data_str.encode("utf-8")).hexdigest()
+        context_cache = self._get_unexpired(self._context_caches, cache_key, now)
+        if context_cache is not None:
+            return context_cache
+
+        try:
+            context_cache = genai.caching.CachedContent.create(
+                model=self.gemini_model_name,
+                display_name=f"podcastgit-{self.repo_owner}-{self.repo_name}"[:128],
+                contents=[data_str],
+                ttl=datetime.timedelta(seconds=self.context_cache_ttl_seconds),
+            )
+        except Exception as e:
+            # Ex: modelo sem suporte a cache explícito. O implícito ainda se beneficia da ordem dados → prompt.
+            self._log_message(f"Cache de contexto da Gemini indisponível ({e}). Enviando os dados na mensagem.", "warning")
+            return None
+
+        self._log_message(f"Dados do repositório guardados no cache de contexto da Gemini ({self.context_cache_ttl_seconds // 60} min).", "info")
+        with self.clients.lock:
+            self._context_caches[cache_key] = (context_cache, now + self.context_cache_ttl_seconds - 30) # Margem antes de expirar no servidor
+        return context_cache
+
+    def _get_unexpired(self, handles, key, now):
+        """Handle guardado em `handles` ({chave: (handle, expira_em)}) para `key`, descartando os expirados."""
+        with self.clients.lock:
+            for expired_key in [k for k, (_, expires_at) in handles.items() if expires_at <= now]:
+                del handles[expired_key]
+            entry = handles.get(key)
+        return entry[0] if entry else None
+
+    def _script_cache_key(self, prompt_text, data_str):
+        """Hash de tudo que determina a resposta da IA (modelo, temperatura, prompt e dados)."""
+        payload = json.dumps({
+            "model": self.gemini_model_name,
+            "temperature": self.generation_config.temperature,
+            "prompt": prompt_text,
+            "data": data_str,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _read_cached_script(self, cache_key):
+        """Roteiro salvo para esta chave, ou None (cache desativado, ausente ou expirado)."""
+        if not self.script_cache_enabled or not cache_key:
+            return None
+        cache_path = self.script_cache_dir / f"{cache_key}.txt"
+        try:
+            if time.time() - cache_path.stat().st_mtime > self.script_cache_ttl_seconds:
+                return None
+            return cache_path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def _write_cached_script(self, cache_key, script):
+        if not self.script_cache_enabled or not cache_key:
+            return
+        cache_path = self.script_cache_dir / f"{cache_key}.txt"
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            tmp_path.write_text(script, encoding="utf-8")
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self._log_message(f"Não foi possível gravar o roteiro no cache ({e}).", "warning")
 
     # --- NOVO MÉTODO PARA PROMPT CONCISO ---
     def _get_concise_prompt(self):
@@ -819,63 +1859,88 @@ class GitHubPodcastGenerator:
 
     # --- MÉTODOS DE EXEMPLO E GERAÇÃO DE ÁUDIO (sem alterações significativas) ---
 
+    def _generation_error(self, error_message):
+        """Cria a PodcastGenerationError, já com o roteiro de exemplo como fallback."""
+        return PodcastGenerationError(error_message, self._generate_stub_podcast_script(error_message))
+
     def _generate_stub_podcast_script(self, error_message="API indisponível ou erro na geração"):
         """Gera um script de exemplo quando a API falha."""
         self._log_message(f"Gerando script de exemplo devido a erro: {error_message}", "warning")
         repo_title = self.repo_summary.get("title", self.repo_name if self.repo_name else "N/A")
         repo_owner_name = self.repo_owner if self.repo_owner else "N/A"
-        main_language = next(iter(self.repo_summary.get("languages", {"código"}).keys()), "código")
+        languages = self.repo_summary.get("languages") or {}
+        main_language = max(languages, key=languages.get, default="código") # Mais arquivos, não a primeira chave
         repo_desc = self.repo_summary.get('description', 'Não foi possível carregar a descrição.')
         repo_link = self.repo_url if self.repo_url else "URL não disponível"
 
         # Tenta incluir o nome do modelo que falhou, se disponível
         model_name_mention = f" (tentativa com {self.gemini_model_name})" if hasattr(self, 'gemini_model_name') and self.gemini_model_name else ""
 
-        return f"""
-        [VINHETA DE ABERTURA]
-
-        LOCUTOR: Olá! Bem-vindos ao Explica Código! Infelizmente, hoje encontramos um problema técnico ao tentar gerar a análise detalhada do repositório{model_name_mention}. A mensagem de erro foi: "{error_message}".
-
-        LOCUTOR: Mesmo sem a análise da IA, vamos dar uma olhada nas informações básicas que conseguimos coletar.
-
-        [VINHETA DE TRANSIÇÃO]
-
-        LOCUTOR: O repositório que íamos explorar é o '{repo_title}', mantido por '{repo_owner_name}'. Pelo que vimos, ele parece ser escrito principalmente em '{main_language}'.
-
-        LOCUTOR: A descrição que encontramos sugere que o objetivo do projeto é: {repo_desc}
-
-        LOCUTOR: Como não conseguimos gerar o roteiro completo, a dica de hoje é mais genérica: ao explorar um novo repositório, sempre comece pelo README.md! Ele geralmente contém a visão geral, instruções de instalação e uso.
-
-        LOCUTOR: Depois do README, procure por arquivos de configuração (como 'package.json', 'requirements.txt', 'pom.xml'), arquivos de ponto de entrada (como 'main.py', 'index.js', 'Program.cs') e a estrutura geral de pastas (como 'src', 'app', 'lib', 'tests', 'docs').
-
-        LOCUTOR: Pedimos desculpas por não termos o episódio completo hoje. Recomendamos que você mesmo navegue pelo repositório no link que deixaremos na descrição, caso ele esteja disponível: {repo_link}
-
-        [VINHETA DE ENCERRAMENTO]
-        ---
-        Roteiro de exemplo gerado devido a erro.
-        Repositório: {repo_link}
-        Erro: {error_message}
-        """
-
-    def generate_podcast_audio(self, script_text, lang='pt-br', vignette_path="background_music.mp3", vignette_duration_ms=5000, progress_callback=None):
+        return STUB_SCRIPT_TEMPLATE.format_map({
+            "model_name_mention": model_name_mention,
+            "error_message": error_message,
+            "repo_title": repo_title,
+            "repo_owner_name": repo_owner_name,
+            "main_language": main_language,
+            "repo_desc": repo_desc,
+            "repo_link": repo_link,
+        })
+
+    def generate_podcast_audio(self, script_text, lang='pt-br', vignette_path="background_music.mp3", vignette_duration_ms=5000, progress_callback=None, audio_format=None):
         """
         Gera o áudio do podcast, inserindo uma vinheta musical curta
         nos locais indicados por marcadores no script.
         **Modificado para limpar melhor o texto antes de enviar ao TTS.**
+        Retorna só o buffer; para saber o formato efetivo, use combine_audio_segments.
+        """
+        try:
+            segments = list(self.iter_audio_segments(script_text, lang, vignette_path, vignette_duration_ms, progress_callback))
+        except Exception as e:
+            self._log_message(f"Erro inesperado durante a geração de áudio: {e}", "error")
+            self._log_message(traceback.format_exc(), "error")
+            return None
+        return self.combine_audio_segments(segments, progress_callback, audio_format)[0]
+
+    def stream_podcast_audio(self, script_text, lang='pt-br', vignette_path="background_music.mp3", vignette_duration_ms=5000, progress_callback=None, audio_format=None):
+        """
+        Gera o podcast como uma sequência de pares (bytes, formato), um arquivo de áudio completo
+        por segmento e na ordem do roteiro, sem montar o podcast inteiro em memória. O formato vem
+        junto porque muda para MP3 se o Opus falhar no meio. Cada segmento é codificado à parte:
+        juntar os bytes não dá um arquivo sem emendas (em Opus vira um Ogg encadeado, em MP3 sobra
+        o atraso/preenchimento do encoder em cada fronteira). Para o arquivo final, use
+        combine_audio_segments.
+        """
+        for segment in self.iter_audio_segments(script_text, lang, vignette_path, vignette_duration_ms, progress_callback):
+            audio_fp, audio_format = self.export_audio(segment, audio_format) # Após uma falha do Opus, segue em MP3
+            yield audio_fp.getvalue(), audio_format
+        if progress_callback:
+            progress_callback(1.0, "Podcast pronto!")
+
+    def iter_audio_segments(self, script_text, lang='pt-br', vignette_path="background_music.mp3", vignette_duration_ms=5000, progress_callback=None):
+        """
+        Gera os segmentos de áudio (vinhetas e falas) um a um, na ordem do roteiro.
+        Permite que a interface toque o início do podcast antes de todo o áudio ficar pronto.
         """
         self._log_message("Preparando áudio do podcast com vinhetas...", "info")
         if progress_callback:
             progress_callback(0.95, "Carregando vinheta e processando roteiro...")
 
+        # --- Processar o roteiro (antes da vinheta: roteiro vazio não paga a decodificação) ---
+        # Divide em QUALQUER marcador entre colchetes (mantendo os marcadores)
+        parts = [p.strip() for p in SCRIPT_MARKER_RE.split(script_text) if p and p.strip()]
+
+        if not parts:
+             self._log_message("Roteiro vazio ou sem partes reconhecíveis após divisão.", "error")
+             return
+
         # --- Carregar e preparar a vinheta ---
         vignette = None # Inicializa como None
-        if vignette_path and Path(vignette_path).exists():
+        if VIGNETTE_MARKERS.isdisjoint(parts):
+            pass # Roteiro sem marcadores de vinheta: nada a decodificar
+        elif vignette_path and Path(vignette_path).exists():
             try:
-                # Aumenta um pouco o fade out para suavizar
-                vignette_full = AudioSegment.from_mp3(vignette_path)
-                vignette = vignette_full[:vignette_duration_ms]
-                fade_duration = min(1000, vignette_duration_ms // 4) # Fade out de até 1s
-                vignette = vignette.fade_out(duration=fade_duration)
+                # mtime na chave: trocar o arquivo invalida a vinheta já processada
+                vignette = self._load_vignette(str(vignette_path), vignette_duration_ms, os.stat(vignette_path).st_mtime_ns)
                 self._log_message(f"Vinheta '{vignette_path}' carregada e preparada ({len(vignette)/1000:.1f}s).", "info")
             except FileNotFoundError:
                 self._log_message(f"Arquivo de vinheta '{vignette_path}' não encontrado. Continuando sem vinhetas.", "warning")
@@ -887,140 +1952,327 @@ class GitHubPodcastGenerator:
              self._log_message(f"Caminho da vinheta não fornecido ou inválido ('{vignette_path}'). Continuando sem vinhetas.", "warning")
              vignette_path = None
 
-        # --- Processar o roteiro e gerar áudio ---
-        final_segments = []
-        # Marcadores que devem inserir a vinheta (se carregada)
-        vignette_markers = [
-            '[VINHETA DE ABERTURA]',
-            '[VINHETA DE TRANSIÇÃO]',
-            '[VINHETA DE ENCERRAMENTO]'
-        ]
-        # Marcadores que devem ser REMOVIDOS do texto falado
-        markers_to_remove = vignette_markers + [
-            '[MÚSICA SUAVE DE FUNDO]', # Exemplo de outros marcadores a remover
-            '[SECTION BREAK]',
-        ]
+        # --- Planejamento: decide o que cada parte vira (vinheta, fala ou nada) ---
+        plan = []
+        for part in parts:
+            is_vignette_marker = part in VIGNETTE_MARKERS
+            is_marker_to_remove = part in MARKERS_TO_REMOVE
+
+            if is_vignette_marker and vignette:
+                plan.append(("vignette", part, 0))
+            elif is_marker_to_remove:
+                # Apenas ignora o marcador se ele deve ser removido e não é de vinheta (ou a vinheta falhou)
+                self._log_message(f"Removendo marcador: {part}", "info")
+            elif part.startswith('[') and part.endswith(']'):
+                 # É um marcador desconhecido, loga e ignora
+                 self._log_message(f"Ignorando marcador desconhecido: {part}", "warning")
+            else: # É um bloco de texto para falar
+                text_to_speak = self._clean_text_for_tts(part)
+                chunks = self._split_for_tts(text_to_speak)
+                for index, chunk in enumerate(chunks):
+                    # Pausa de respiração só ao fim do bloco, não entre frases do mesmo bloco
+                    plan.append(("speech", chunk, 300 if index == len(chunks) - 1 else 0))
+
+        total_parts = len(plan)
+        if not total_parts:
+            return
+
+        # --- Síntese paralela: as chamadas ao TTS são I/O puro, então rodam em threads ---
+        # Cada trecho (grupo de frases) é uma chamada; os resultados são consumidos na ordem
+        # do roteiro e o progresso é reportado desta thread, não pelos workers.
+        report_progress = self._throttle_progress(progress_callback)
+        with self._worker_pool(self.max_tts_workers) as executor:
+            futures = [
+                executor.submit(self._synthesize_speech, payload, lang, pause_ms) if kind == "speech" else None
+                for kind, payload, pause_ms in plan
+            ]
+            for processed_parts, ((kind, payload, _), future) in enumerate(zip(plan, futures), start=1):
+                if kind == "vignette":
+                    self._log_message(f"Adicionando vinheta para o marcador: {payload}", "info")
+                    segment = vignette
+                else:
+                    segment = future.result()
 
-        # Padrão para encontrar QUALQUER marcador entre colchetes
-        marker_pattern = r'(\[.*?\])'
-        parts = [p.strip() for p in re.split(marker_pattern, script_text) if p and p.strip()]
-
-        if not parts:
-             self._log_message("Roteiro vazio ou sem partes reconhecíveis após divisão.", "error")
-             return None
-
-        total_parts = len(parts)
-        processed_parts = 0
-
-        try:
-            for part in parts:
-                processed_parts += 1
                 # Calcula progresso da etapa de áudio (últimos 5%)
                 current_progress = 0.95 + (0.05 * (processed_parts / total_parts))
-                if progress_callback:
-                     progress_callback(current_progress, f"Processando áudio parte {processed_parts}/{total_parts}...")
-
-                is_vignette_marker = part in vignette_markers
-                is_marker_to_remove = part in markers_to_remove
-
-                if is_vignette_marker and vignette:
-                    self._log_message(f"Adicionando vinheta para o marcador: {part}", "info")
-                    final_segments.append(vignette)
-                elif is_marker_to_remove:
-                    # Apenas ignora o marcador se ele deve ser removido e não é de vinheta (ou a vinheta falhou)
-                    self._log_message(f"Removendo marcador: {part}", "info")
-                    continue
-                elif part.startswith('[') and part.endswith(']'):
-                     # É um marcador desconhecido, loga e ignora
-                     self._log_message(f"Ignorando marcador desconhecido: {part}", "warning")
-                     continue
-                else: # É um bloco de texto para falar
-                    # 1. Limpeza inicial (metadados no final, linhas vazias)
-                    text_to_speak = re.sub(r'---\n.*', '', part, flags=re.DOTALL).strip()
-                    text_to_speak = "\n".join(line for line in text_to_speak.splitlines() if line.strip())
-
-                    if not text_to_speak:
-                        continue # Pula se não sobrou texto útil
-
-                    # 2. Limpeza específica para TTS (REMOVER MARCADORES INDESEJADOS)
-                    # Remove **LOCUTOR:** ou LOCUTOR: (com ou sem asteriscos e espaços) no início das linhas
-                    text_to_speak = re.sub(r'^\s*(\*\*)*(LOCUTOR:|HOST:)(\*\*)*\s*', '', text_to_speak, flags=re.IGNORECASE | re.MULTILINE)
-                    # Remove asteriscos de negrito/itálico (**) ou (*)
-                    text_to_speak = re.sub(r'\*(\*?)(.*?)\1\*', r'\2', text_to_speak) # Remove **texto** ou *texto* deixando só 'texto'
-                    # Remove crases (backticks) usadas para código inline
-                    text_to_speak = re.sub(r'`', '', text_to_speak)
-                    # Remove cabeçalhos Markdown (#, ##, etc.) no início das linhas
-                    text_to_speak = re.sub(r'^\s*#+\s+', '', text_to_speak, flags=re.MULTILINE)
-                    # Remove possíveis marcadores de lista restantes (- , * , + ) no início de linha se não foram convertidos em frase
-                    text_to_speak = re.sub(r'^\s*[-*+]\s+', '', text_to_speak, flags=re.MULTILINE)
-                    # Remove links markdown [texto](url), mantendo só o texto
-                    text_to_speak = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text_to_speak)
-
-                    # Limpa espaços extras que podem ter sido deixados pelas substituições
-                    text_to_speak = re.sub(r'\s+', ' ', text_to_speak).strip()
-                    # Tenta corrigir pontuação comum antes de vírgulas/pontos
-                    text_to_speak = re.sub(r'\s([?.!,:])', r'\1', text_to_speak)
-
-                    if text_to_speak:
-                        self._log_message(f"Gerando fala para: '{textwrap.shorten(text_to_speak, 80)}...'", "info")
-                        try:
-                            # --- Geração de Fala com gTTS ---
-                            tts = gTTS(text=text_to_speak, lang=lang, slow=False)
-                            speech_fp = io.BytesIO()
-                            tts.write_to_fp(speech_fp)
-                            speech_fp.seek(0)
-
-                            # --- Carregamento com Pydub ---
-                            try:
-                                speech_segment = AudioSegment.from_mp3(speech_fp)
-                                # Adiciona um pequeno silêncio após cada bloco de fala para melhor respiração
-                                final_segments.append(speech_segment)
-                                final_segments.append(AudioSegment.silent(duration=300)) # 300ms de silêncio
-                                self._log_message(f"Segmento de fala gerado ({len(speech_segment)/1000:.1f}s).", "info")
-                            except Exception as e_pydub:
-                                 self._log_message(f"Erro ao carregar segmento de fala com pydub: {e_pydub}. Verifique ffmpeg. Pulando segmento.", "warning")
-                                 # Tenta logar mais detalhes se for erro de decodificação
-                                 if "decoder" in str(e_pydub).lower():
-                                     self._log_message("Isso pode indicar um problema com a instalação do ffmpeg ou formato de áudio inesperado do gTTS.", "warning")
-                                 continue # Pula este segmento
-
-                        except Exception as e_tts:
-                            self._log_message(f"Erro ao gerar fala para um segmento com gTTS: {e_tts}", "warning")
-                            # Verifica erros comuns do gTTS
-                            if "429 (Too Many Requests)" in str(e_tts):
-                                self._log_message("gTTS retornou erro 429 - limite de requisições atingido. Tente novamente mais tarde.", "error")
-                                # Poderia implementar um backoff aqui, mas por simplicidade, apenas avisamos.
-                            continue # Pula este segmento
+                if report_progress:
+                     report_progress(current_progress, f"Processando áudio parte {processed_parts}/{total_parts}...", final=processed_parts == total_parts)
+
+                if segment is not None:
+                    yield segment
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4)
+    def _load_vignette(vignette_path, vignette_duration_ms, mtime_ns):
+        """Decodifica, corta e aplica o fade na vinheta. O AudioSegment é imutável, então é compartilhado entre gerações."""
+        vignette_full = AudioSegment.from_file(vignette_path, format="mp3", codec=MP3_DECODER)
+        vignette = vignette_full[:vignette_duration_ms]
+        fade_duration = min(1000, vignette_duration_ms // 4) # Fade out de até 1s
+        return vignette.fade_out(duration=fade_duration)
+
+    def _clean_text_for_tts(self, part):
+        """Limpa um bloco do roteiro (markdown, locutor, metadados) para envio ao TTS."""
+        # 1. Limpeza inicial (metadados no final). Linhas vazias somem no colapso de espaços do fim.
+        text_to_speak = SCRIPT_FOOTER_RE.sub('', part).strip()
+
+        if not text_to_speak:
+            return "" # Não sobrou texto útil
+
+        # 2. Limpeza específica para TTS (REMOVER MARCADORES INDESEJADOS)
+        # Remove **LOCUTOR:** ou LOCUTOR: (com ou sem asteriscos e espaços) no início das linhas
+        text_to_speak = TTS_SPEAKER_RE.sub('', text_to_speak)
+        # Remove asteriscos de negrito/itálico (**) ou (*)
+        text_to_speak = TTS_EMPHASIS_RE.sub(r'\2', text_to_speak) # Remove **texto** ou *texto* deixando só 'texto'
+        # Remove crases (backticks) usadas para código inline
+        text_to_speak = text_to_speak.replace('`', '')
+        # Remove cabeçalhos Markdown (#, ##, etc.) no início das linhas
+        text_to_speak = TTS_HEADING_RE.sub('', text_to_speak)
+        # Remove possíveis marcadores de lista restantes (- , * , + ) no início de linha se não foram convertidos em frase
+        text_to_speak = TTS_LIST_BULLET_RE.sub('', text_to_speak)
+        # Remove links markdown [texto](url), mantendo só o texto
+        text_to_speak = TTS_LINK_RE.sub(r'\1', text_to_speak)
+
+        # Limpa espaços extras que podem ter sido deixados pelas substituições
+        text_to_speak = TTS_WHITESPACE_RE.sub(' ', text_to_speak).strip()
+        # Tenta corrigir pontuação comum antes de vírgulas/pontos
+        text_to_speak = TTS_SPACE_BEFORE_PUNCT_RE.sub(r'\1', text_to_speak)
+        return text_to_speak
+
+    def _split_for_tts(self, text_to_speak):
+        """Divide o texto em frases e as reagrupa em trechos de até `tts_chunk_chars` caracteres."""
+        chunks = []
+        current = ""
+        for sentence in SENTENCE_BOUNDARY_RE.split(text_to_speak):
+            if current and len(current) + 1 + len(sentence) > self.tts_chunk_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+        return chunks
 
+    def _tts_gtts(self, text_to_speak, lang):
+        """
+        Provedor gTTS: uma requisição por trecho de ~100 caracteres, sem streaming. As requisições
+        montadas pelo gTTS são enviadas pela `tts_session` (o gTTS abriria uma conexão TLS nova
+        para cada uma); a extração do áudio segue a do próprio gTTS. Se esses internos mudarem
+        (versão fixada em requirements.txt), cai para o `write_to_fp` público do gTTS.
+        """
+        tts = gTTS(text=text_to_speak, lang=lang, slow=False)
+        prepare_requests = getattr(tts, "_prepare_requests", None)
+        if prepare_requests is None:
+            return self._tts_gtts_public(tts)
+        speech_fp = io.BytesIO()
+        for prepared in prepare_requests():
+            settings = self.tts_session.merge_environment_settings(prepared.url, {}, None, None, None) # Proxies/CA do ambiente
+            response = self.tts_session.send(prepared, timeout=self.request_timeout, **settings)
+            if not response.ok:
+                raise gTTSError(tts=tts, response=response) # Mensagem inclui o status (ex: 429)
+            audio_chunks = [GTTS_AUDIO_RE.search(line) for line in response.text.splitlines() if "jQ1olc" in line]
+            if not audio_chunks or not all(audio_chunks):
+                # Formato de resposta diferente do esperado: deixa o próprio gTTS interpretar
+                self._log_message("Resposta do gTTS em formato inesperado; usando a API pública do gTTS.", "warning")
+                return self._tts_gtts_public(tts)
+            for match in audio_chunks:
+                speech_fp.write(base64.b64decode(match.group(1)))
+        speech_fp.seek(0)
+        return speech_fp
+
+    def _tts_gtts_public(self, tts):
+        """Caminho só com a API pública do gTTS (conexões próprias dele, sem a `tts_session`)."""
+        speech_fp = io.BytesIO()
+        tts.write_to_fp(speech_fp) # Levanta gTTSError em falhas HTTP (ex: 429), como o caminho principal
+        speech_fp.seek(0)
+        return speech_fp
+
+    def _tts_edge(self, text_to_speak, lang):
+        """
+        Provedor edge-tts: vozes neurais do serviço de leitura do Microsoft Edge, em streaming
+        e sem cota por minuto como a do gTTS. O idioma vem da voz (`edge_tts_voice`), e o
+        áudio já chega em MP3, como nos outros provedores.
+        """
+        if edge_tts is None:
+            raise ValueError("Pacote edge-tts não instalado (pip install edge-tts).")
+
+        async def collect_audio():
+            speech_fp = io.BytesIO()
+            async for chunk in edge_tts.Communicate(text_to_speak, self.edge_tts_voice).stream():
+                if chunk["type"] == "audio":
+                    speech_fp.write(chunk["data"])
+            return speech_fp
+
+        speech_fp = asyncio.run(collect_audio()) # Cada thread do pool de TTS roda seu próprio loop
+        if not speech_fp.getbuffer().nbytes:
+            raise ValueError("edge-tts não retornou áudio.")
+        speech_fp.seek(0)
+        return speech_fp
+
+    def _tts_elevenlabs(self, text_to_speak, lang):
+        """Provedor ElevenLabs: endpoint de streaming, com latência ajustável (optimize_streaming_latency)."""
+        if not self.elevenlabs_api_key:
+            raise ValueError("API Key da ElevenLabs não configurada.")
+        api_url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.elevenlabs_voice_id}/stream"
+        response = self.tts_session.post(
+            api_url,
+            params={"optimize_streaming_latency": self.tts_streaming_latency, "output_format": "mp3_44100_128"},
+            headers={"xi-api-key": self.elevenlabs_api_key, "Accept": "audio/mpeg"},
+            json={"text": text_to_speak, "model_id": self.elevenlabs_model_id}, # Modelo multilíngue: o idioma vem do texto
+            stream=True,
+            timeout=self.request_timeout,
+        )
+        response.raise_for_status()
+        speech_fp = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=16384):
+            speech_fp.write(chunk)
+        speech_fp.seek(0)
+        return speech_fp
+
+    def _synthesize_speech(self, text_to_speak, lang, pause_ms=300):
+        """Converte um trecho de texto em fala (provedor de TTS + Pydub). Retorna None em caso de falha."""
+        self._log_message(f"Gerando fala para: '{textwrap.shorten(text_to_speak, 80)}...'", "info")
+        tts_backend = self.tts_backends.get(self.tts_provider, self._tts_gtts)
+        cache_path = self._tts_cache_path(text_to_speak, lang)
+        speech_fp = self._read_cached_speech(cache_path)
+        from_cache = speech_fp is not None
+        try:
+            # --- Geração de Fala com o provedor configurado ---
+            if not from_cache:
+                speech_fp = self._call_with_rate_limit_retry(self.tts_provider, tts_backend, text_to_speak, lang)
+        except Exception as e_tts:
+            self._log_message(f"Erro ao gerar fala para um segmento com {self.tts_provider}: {e_tts}", "warning")
+            # Verifica erros comuns do gTTS / provedores
+            if self._is_rate_limit_error(e_tts):
+                self._log_message(f"{self.tts_provider} continuou retornando erro 429 após {self.api_rate_limit_retries} novas tentativas. Tente novamente mais tarde.", "error")
+            return None # Pula este segmento
+
+        # --- Carregamento com Pydub ---
+        try:
+            with speech_fp: # Fecha o buffer logo após decodificar, mesmo em caso de erro
+                speech_segment = AudioSegment.from_file(speech_fp, format="mp3", codec=MP3_DECODER)
+                if not from_cache:
+                    self._write_cached_speech(cache_path, speech_fp.getvalue()) # Só áudio que decodificou
+            self._log_message(f"Segmento de fala {'reaproveitado do cache' if from_cache else 'gerado'} ({len(speech_segment)/1000:.1f}s).", "info")
+            # Adiciona um pequeno silêncio após cada bloco de fala para melhor respiração
+            if pause_ms:
+                speech_segment += AudioSegment.silent(duration=pause_ms)
+            return speech_segment
+        except Exception as e_pydub:
+             self._log_message(f"Erro ao carregar segmento de fala com pydub: {e_pydub}. Verifique ffmpeg. Pulando segmento.", "warning")
+             if from_cache:
+                 cache_path.unlink(missing_ok=True) # Arquivo corrompido: a próxima geração sintetiza de novo
+             # Tenta logar mais detalhes se for erro de decodificação
+             if "decoder" in str(e_pydub).lower():
+                 self._log_message("Isso pode indicar um problema com a instalação do ffmpeg ou formato de áudio inesperado do gTTS.", "warning")
+             return None # Pula este segmento
+
+    def _tts_cache_path(self, text_to_speak, lang):
+        """Arquivo do áudio em cache para o trecho: hash do provedor, da voz/idioma e do texto enviado."""
+        if self.tts_provider == "elevenlabs":
+            voice = [self.elevenlabs_voice_id, self.elevenlabs_model_id, self.tts_streaming_latency]
+        elif self.tts_provider == "edge":
+            voice = [self.edge_tts_voice]
+        else:
+            voice = [lang]
+        key = json.dumps([self.tts_provider, voice, text_to_speak], ensure_ascii=False)
+        key_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.tts_cache_dir / key_hash[:2] / f"{key_hash}.mp3"
+
+    def _read_cached_speech(self, cache_path):
+        """Buffer com o MP3 salvo para o trecho, ou None (cache desativado ou ausente)."""
+        if not self.tts_cache_enabled:
+            return None
+        try:
+            speech_fp = io.BytesIO(cache_path.read_bytes())
+            os.utime(cache_path) # Marca como usado recentemente (a limpeza remove pelo mtime)
+        except OSError:
+            return None
+        return speech_fp
+
+    def _write_cached_speech(self, cache_path, audio_bytes):
+        """Salva o MP3 do trecho; falhas de disco só desativam o cache."""
+        if not self.tts_cache_enabled:
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Nome temporário por thread: trechos iguais podem ser sintetizados ao mesmo tempo
+            tmp_path = cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(audio_bytes)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self._log_message(f"Não foi possível gravar no cache de áudio ({e}).", "warning")
+            return
+        self._tts_cache_writes += 1
+        if self._tts_cache_writes % self.tts_cache_prune_every == 0:
+            self._prune_cache_dir(self.tts_cache_dir, "*/*.mp3", self.max_tts_cache_bytes)
+
+    def export_audio(self, audio, audio_format=None):
+        """
+        Exporta um AudioSegment para um buffer em memória (mono, bitrate de voz) no formato
+        `audio_format` (chave de AUDIO_FORMATS; padrão: self.audio_format).
+        Retorna (buffer, formato efetivo): se o Opus falhar, o áudio sai em MP3, e quem chama
+        deve usar o formato devolvido nas próximas exportações.
+        """
+        if audio_format not in AUDIO_FORMATS:
+            audio_format = self.audio_format if self.audio_format in AUDIO_FORMATS else "mp3"
+        spec = AUDIO_FORMATS[audio_format]
+        audio_fp = io.BytesIO()
+        try:
+            audio.set_channels(1).export(audio_fp, format=spec["format"], codec=spec["codec"], bitrate=spec["bitrate"])
+        except Exception as e:
+            if spec is AUDIO_FORMATS["mp3"]:
+                raise
+            # Ex: ffmpeg compilado sem libopus. Usa MP3 (o formato não é guardado na instância)
+            self._log_message(f"Não foi possível exportar em {audio_format} ({e}). Usando MP3.", "warning")
+            return self.export_audio(audio, "mp3")
+        audio_fp.seek(0)
+        return audio_fp, audio_format
+
+    @staticmethod
+    def _trim_edge_silence(audio, silence_thresh, chunk_ms=10, padding_ms=100):
+        """
+        Corta o silêncio das pontas do áudio, mantendo `padding_ms` de margem. Varre só a partir
+        do início e do fim (não o áudio inteiro, como strip_silence), e as pausas entre
+        blocos de fala ficam como foram geradas.
+        """
+        start = detect_leading_silence(audio, silence_threshold=silence_thresh, chunk_size=chunk_ms)
+        if start >= len(audio):
+            return audio # Tudo abaixo do limiar: melhor manter do que devolver áudio vazio
+        end = len(audio)
+        while end - chunk_ms > start and audio[end - chunk_ms:end].dBFS < silence_thresh:
+            end -= chunk_ms
+        return audio[max(0, start - padding_ms):min(len(audio), end + padding_ms)]
+
+    def combine_audio_segments(self, segments, progress_callback=None, audio_format=None):
+        """
+        Combina os segmentos gerados por iter_audio_segments no áudio final do podcast.
+        Retorna (buffer, formato efetivo), ou (None, formato pedido) em caso de falha.
+        """
+        try:
             # --- Combinar todos os segmentos ---
-            if not final_segments:
+            if not segments:
                 self._log_message("Nenhum segmento de áudio foi gerado.", "error")
-                return None
+                return None, audio_format
 
             self._log_message("Combinando segmentos de fala e vinhetas...", "info")
-            combined_audio = AudioSegment.empty()
-            for segment in final_segments:
-                 combined_audio += segment
+            # Junta o PCM de uma vez: `+=` em laço copiaria todo o áudio acumulado a cada segmento (O(N²))
+            synced_segments = AudioSegment._sync(*segments) # Mesmo frame rate, canais e largura de amostra
+            combined_audio = synced_segments[0]._spawn([segment.raw_data for segment in synced_segments])
 
-            # Remove silêncio extra no final, se houver
+            # Remove silêncio extra no início e no final, se houver
             if len(combined_audio) > 0:
-                combined_audio = combined_audio.strip_silence(silence_len=100, silence_thresh=combined_audio.dBFS - 16) # Ajuste threshold se necessário
+                combined_audio = self._trim_edge_silence(combined_audio, silence_thresh=combined_audio.dBFS - 16) # Ajuste threshold se necessário
 
 
             # --- Exportar o áudio final ---
-            final_audio_fp = io.BytesIO()
-            # Exporta com bitrate razoável para podcasts
-            combined_audio.export(final_audio_fp, format="mp3", bitrate="128k")
-            final_audio_fp.seek(0)
+            final_audio_fp, audio_format = self.export_audio(combined_audio, audio_format)
 
             self._log_message(f"Áudio final com vinhetas gerado com sucesso! Duração total: {len(combined_audio)/1000:.1f}s", "success")
             if progress_callback:
                  progress_callback(1.0, "Podcast pronto!")
-            return final_audio_fp
+            return final_audio_fp, audio_format
 
         except Exception as e:
             self._log_message(f"Erro inesperado durante a geração/concatenação de áudio: {e}", "error")
-            import traceback
             self._log_message(traceback.format_exc(), "error")
-            return None
-
+            return None, audio_format